@@ -1,128 +1,377 @@
 import sys
 import os
 import json
-import shutil
-import subprocess
-import re
-import platform
+import threading
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QLineEdit, QPushButton, QSlider, QCheckBox, 
                              QComboBox, QProgressBar, QTextEdit, QFileDialog, QMessageBox, 
-                             QGroupBox, QDoubleSpinBox, QStyleFactory, QGridLayout, QRadioButton, QButtonGroup)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+                             QGroupBox, QDoubleSpinBox, QStyleFactory, QGridLayout, QRadioButton, QButtonGroup,
+                             QSpinBox, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QSizePolicy)
+from PyQt6.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+from dme_core import create_job, find_ffmpeg, auto_sigmar, default_concurrency, collect_inputs, format_eta, parse_variants, PLAN_MODES, ENGINES, EXPORT_EXTS
+from dme_core import ffmpeg_capabilities, cached_capabilities, calibrate_encoders, CODEC_PRESETS, X26X_PRESETS
+from dme_farm import FarmClient, LOST_JOB
+import dme_numpy
 
 # ==========================================
-# 1. 인코딩 작업자 스레드
+# 1. 인코딩 작업자 스레드 (dme_core.EncodeJob 이벤트를 Qt 시그널로 전달)
 # ==========================================
 class EncoderWorker(QThread):
     progress_signal = pyqtSignal(int)
+    stats_signal = pyqtSignal(object)
     log_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
     error_signal = pyqtSignal(str)
 
     def __init__(self, params):
         super().__init__()
-        self.params = params
-        self.is_running = True
-        self.process = None
-
-    def get_duration(self, file_path):
-        ffmpeg_path = self.params.get('ffmpeg_path')
-        base_dir = os.path.dirname(ffmpeg_path)
-        ffprobe_name = "ffprobe.exe" if platform.system() == "Windows" else "ffprobe"
-        ffprobe_path = os.path.join(base_dir, ffprobe_name)
-        creation_flags = 0x08000000 if platform.system() == "Windows" else 0
-
-        if os.path.exists(ffprobe_path):
-            try:
-                cmd = [ffprobe_path, "-v", "error", "-show_entries", "format=duration", 
-                       "-of", "default=noprint_wrappers=1:nokey=1", file_path]
-                result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
-                                        text=True, encoding='utf-8', creationflags=creation_flags, timeout=5)
-                return float(result.stdout.strip())
-            except: pass
-        return 0
-
-    def get_unique_path(self, folder, base_name, ext):
-        path = os.path.join(folder, f"{base_name}.{ext}")
-        if not os.path.exists(path): return path
-        counter = 1
-        while True:
-            new_path = os.path.join(folder, f"{base_name} ({counter}).{ext}")
-            if not os.path.exists(new_path): return new_path
-            counter += 1
+        self.params, self.error = params, None
+        # 이 ffmpeg에서 안 되는 코덱 등은 작업 실패로 처리 (시그널 처리 중 예외로 앱이 멈추지 않도록)
+        try: self.job = create_job(params)
+        except ValueError as e: self.job, self.error = None, str(e)
+
+    @property
+    def is_running(self): return self.job is not None and self.job.is_running
 
     def run(self):
-        ffmpeg_path = self.params.get('ffmpeg_path')
-        input_path = self.params['input_path']
-        output_folder = self.params['output_folder']
-        
-        duration = self.get_duration(input_path)
-        filename = os.path.basename(input_path)
-        name_only, _ = os.path.splitext(filename)
-        
-        setting_suffix = f"_G{self.params['blur']:.2f}_S{self.params['sigmar']:.3f}"
-        output_path = self.get_unique_path(output_folder, f"{name_only}{setting_suffix}", self.params['ext'])
-
-        vf_chain = ["crop=iw/2:ih:iw/2:0"] 
-        if self.params['use_filter']:
-            vf_chain.append(f"gblur=sigma={self.params['blur']}")
-            vf_chain.append(f"bilateral=sigmaS={self.params['blur']}:sigmaR={self.params['sigmar']}")
-        if self.params['res_mode'] != "none":
-            vf_chain.append(f"scale={self.params['res_mode']}:{self.params['res_mode']}")
-            
-        if self.params.get('aspect_ratio', "NONE") != "NONE":
-            vf_chain.append(f"setdar={self.params['aspect_ratio']}")
-        
-        cmd = [ffmpeg_path, "-y", "-i", input_path, "-vf", ",".join(vf_chain), 
-               "-c:v", self.params['codec'], "-preset", self.params['preset']]
-        
-        if "nvenc" in self.params['codec']:
-            cmd.extend(["-cq", str(self.params['crf'])])
-        else:
-            cmd.extend(["-crf", str(self.params['crf'])])
-        cmd.extend(["-c:a", "copy", output_path])
-
-        self.log_signal.emit(f"▶ Start Processing: {filename}")
-        creation_flags = 0x08000000 if platform.system() == "Windows" else 0
-        
-        self.process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-            universal_newlines=True, encoding='utf-8', errors='ignore', creationflags=creation_flags
-        )
-        
-        for line in self.process.stdout:
-            if not self.is_running: break
-            time_match = re.search(r"time=(\d+):(\d+):(\d+).(\d+)", line)
-            if time_match and duration > 0:
-                h, m, s, _ = map(int, time_match.groups())
-                current_time = h * 3600 + m * 60 + s
-                prog = int((current_time / duration) * 100)
-                self.progress_signal.emit(min(prog, 99))
-        
-        if self.process:
-            self.process.wait()
-        
-        if self.is_running:
-            self.progress_signal.emit(100)
-            self.finished_signal.emit()
+        if self.error: self.error_signal.emit(self.error); return
+        # 작업 중 예외(출력 폴더 없음, 쓰기 실패 등)는 작업 실패로 알림 (스레드에서 빠져나가면 상태가 "처리 중"에 멈춤)
+        try:
+            for kind, value in self.job.run():
+                if kind == "progress": self.progress_signal.emit(value)
+                elif kind == "stats": self.stats_signal.emit(value)
+                elif kind == "log": self.log_signal.emit(value)
+                elif kind == "error": self.error_signal.emit(value)
+                elif kind == "done": self.finished_signal.emit()
+        except Exception as e:
+            self.error_signal.emit(f"{os.path.basename(self.params['input_path'])}: {type(e).__name__}: {e}")
 
     def stop(self):
-        self.is_running = False
-        if self.process:
-            self.process.kill()
-            self.process = None
+        if self.job: self.job.stop()
+
+# ==========================================
+# 2. 배치 스케줄러 (동시 작업 풀)
+# ==========================================
+class BatchScheduler(QObject):
+    job_progress = pyqtSignal(int, int)
+    job_stats = pyqtSignal(int, object)
+    job_log = pyqtSignal(int, str)
+    job_state = pyqtSignal(int, str)
+    overall_progress = pyqtSignal(int)
+    all_finished = pyqtSignal()
+
+    def __init__(self, max_workers=1, parent=None):
+        super().__init__(parent)
+        self.max_workers = max(1, max_workers)
+        self.jobs = {}      # job_id -> {"params", "state", "progress"}
+        self.pending = []   # 대기열 (FIFO)
+        self.running = {}   # job_id -> EncoderWorker
+        self.retired = []   # 중단된 스레드가 끝날 때까지 참조 유지
+        self.active = False
+
+    def submit(self, job_id, params):
+        self.jobs[job_id] = {"params": params, "state": "queued", "progress": 0}
+        self.job_state.emit(job_id, "queued")
+        self.pending.append(job_id); self.active = True
+        self._pump()
+
+    def set_max_workers(self, n):
+        self.max_workers = max(1, n); self._pump()
+
+    def is_busy(self): return bool(self.pending or self.running)
+
+    def cancel(self, job_id):
+        if job_id in self.pending:
+            self.pending.remove(job_id)
+        elif job_id in self.running:
+            self.running[job_id].stop(); self._release(job_id)
+        else: return
+        self._finish_job(job_id, "cancelled")
+
+    def stop_all(self):
+        for job_id in list(self.pending) + list(self.running): self.cancel(job_id)
+
+    # QThread는 run()이 완전히 끝날 때까지 참조를 유지해야 함
+    def _release(self, job_id):
+        w = self.running.pop(job_id, None)
+        if w is None: return False
+        self.retired.append(w)
+        w.finished.connect(self._on_retired)
+        if w.isFinished(): self.retired.remove(w)
+        return True
+
+    def _on_retired(self):
+        w = self.sender()
+        if w in self.retired: self.retired.remove(w)
+
+    def _pump(self):
+        while self.pending and len(self.running) < self.max_workers:
+            job_id = self.pending.pop(0)
+            w = EncoderWorker(self.jobs[job_id]["params"]); w.job_id = job_id
+            w.progress_signal.connect(self._on_progress)
+            w.stats_signal.connect(self._on_stats)
+            w.log_signal.connect(self._on_log)
+            w.finished_signal.connect(self._on_done)
+            w.error_signal.connect(self._on_error)
+            self.running[job_id] = w
+            self.jobs[job_id]["state"] = "running"; self.job_state.emit(job_id, "running")
+            w.start()
+        if self.active and not self.is_busy():
+            self.active = False; self.all_finished.emit()
+
+    # 작업자 시그널은 sender()로 작업을 식별 (큐 연결로 GUI 스레드에서 실행됨)
+    def _on_progress(self, v):
+        job_id = getattr(self.sender(), "job_id", None)
+        if job_id not in self.running: return
+        self.jobs[job_id]["progress"] = v; self.job_progress.emit(job_id, v)
+        self._emit_overall()
+
+    def _on_stats(self, stats):
+        job_id = getattr(self.sender(), "job_id", None)
+        if job_id in self.running: self.job_stats.emit(job_id, stats)
+
+    def _on_log(self, msg):
+        job_id = getattr(self.sender(), "job_id", None)
+        if job_id in self.jobs: self.job_log.emit(job_id, msg)
+
+    def _on_done(self):
+        job_id = getattr(self.sender(), "job_id", None)
+        if self._release(job_id): self._finish_job(job_id, "done")
+
+    def _on_error(self, e):
+        job_id = getattr(self.sender(), "job_id", None)
+        if self._release(job_id):
+            self.job_log.emit(job_id, e); self._finish_job(job_id, "failed")
+
+    def _finish_job(self, job_id, state):
+        job = self.jobs[job_id]
+        job["state"] = state
+        if state == "done": job["progress"] = 100; self.job_progress.emit(job_id, 100)
+        self.job_state.emit(job_id, state)
+        self._emit_overall(); self._pump()
+
+    def _emit_overall(self):
+        batch = list(self.jobs.values())
+        if not batch: return
+        total = sum(100 if j["state"] in ("done", "failed", "cancelled") else j["progress"] for j in batch)
+        self.overall_progress.emit(int(total / len(batch)))
+
+    def reset(self):
+        if not self.is_busy(): self.jobs = {}
 
 # ==========================================
-# 2. 메인 GUI 클래스
+# 2-1. 원격 스케줄러 (dme_farm 코디네이터에 제출하고 진행 상황을 주기적으로 가져옴)
+# ==========================================
+class RemoteScheduler(QObject):
+    # BatchScheduler와 같은 시그널/메서드. 동시 작업 수는 작업자 노드의 슬롯이 결정
+    job_progress = pyqtSignal(int, int)
+    job_stats = pyqtSignal(int, object)
+    job_log = pyqtSignal(int, str)
+    job_state = pyqtSignal(int, str)
+    overall_progress = pyqtSignal(int)
+    all_finished = pyqtSignal()
+
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client, self.max_workers = client, 1
+        self.jobs = {}      # job_id -> {"params", "state", "progress", "remote", "log_seq"}
+        self.lock = threading.Lock()
+        self.wake, self.halt = threading.Event(), threading.Event()
+        self.active = self.offline = False
+        threading.Thread(target=self._poll_loop, daemon=True).start()
+
+    def submit(self, job_id, params):
+        with self.lock:
+            self.jobs[job_id] = {"params": params, "state": "queued", "progress": 0, "remote": None, "log_seq": 0, "cancel": False}
+            self.active = True
+        self.job_state.emit(job_id, "queued"); self.wake.set()
+
+    def set_max_workers(self, n): self.max_workers = max(1, n)
+
+    def is_busy(self):
+        with self.lock: return any(j["state"] in ("queued", "running") for j in self.jobs.values())
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job["state"] not in ("queued", "running"): return
+            job["cancel"], job["state"] = True, "cancelled"
+        self._finish_job(job_id, "cancelled"); self.wake.set()
+
+    def stop_all(self):
+        for job_id in list(self.jobs): self.cancel(job_id)
+
+    def shutdown(self): self.halt.set(); self.wake.set()
+
+    def reset(self):
+        if not self.is_busy():
+            with self.lock: self.jobs = {}
+
+    def _poll_loop(self):
+        # 어떤 예외로도 스레드가 죽지 않게 함 (죽으면 원격 작업 추적이 멈추고 배치가 끝나지 않음)
+        while not self.halt.is_set():
+            self.wake.wait(1.0); self.wake.clear()
+            try: self._sync(); self.offline = False
+            except Exception as e:  # 코디네이터가 잠시 끊겨도 다음 주기에 다시 시도 (알림은 한 번만)
+                if not self.offline:
+                    self.offline = True
+                    reason = e if isinstance(e, OSError) else f"{type(e).__name__}: {e}"
+                    with self.lock: pending = [j for j, job in self.jobs.items() if job["state"] in ("queued", "running")]
+                    for job_id in pending: self.job_log.emit(job_id, f"Farm unreachable: {reason}")
+
+    def _sync(self):
+        # 네트워크 호출은 잠금 밖에서, 작업 상태 변경은 잠금 안에서 (GUI 스레드의 cancel/reset과 경합)
+        with self.lock: items = list(self.jobs.items())
+        for job_id, job in items:
+            with self.lock: remote, cancel, state = job["remote"], job["cancel"], job["state"]
+            if remote is None and not cancel:
+                remote = self.client.submit(job["params"])
+                with self.lock: job["remote"] = remote  # 그사이 취소됐으면 다음 주기에 취소를 전달
+            elif remote and cancel and state == "cancelled":
+                self.client.cancel(remote)
+                with self.lock: job["remote"] = ""  # 한 번만 전달
+        with self.lock:
+            ids = {job["remote"]: job_id for job_id, job in items if job["remote"] and job["state"] in ("queued", "running")}
+        if ids:
+            reports = self.client.jobs(list(ids))
+            for remote in set(ids) - {r["id"] for r in reports}:  # 코디네이터가 재시작돼 모르는 작업은 실패 처리
+                job_id = ids[remote]
+                with self.lock:
+                    job = self.jobs.get(job_id)
+                    if not job or job["state"] not in ("queued", "running"): continue
+                    job["state"] = "failed"
+                self.job_log.emit(job_id, LOST_JOB); self._finish_job(job_id, "failed")
+            for r in reports:
+                job_id = ids.get(r["id"]); finished = None
+                with self.lock:
+                    job = self.jobs.get(job_id)
+                    if not job or job["state"] not in ("queued", "running"): continue  # 그사이 취소/초기화됨
+                    new = r["log_seq"] - job["log_seq"]; job["log_seq"] = r["log_seq"]
+                    for line in r["log"][-new:] if new > 0 else []: self.job_log.emit(job_id, line)
+                    if r["state"] == "running":
+                        if job["state"] != "running":
+                            job["state"] = "running"; self.job_state.emit(job_id, "running")
+                            self.job_log.emit(job_id, f"Running on farm worker {r['worker']}")
+                        if r["progress"] != job["progress"]:
+                            job["progress"] = r["progress"]; self.job_progress.emit(job_id, r["progress"])
+                        if r["stats"]: self.job_stats.emit(job_id, r["stats"])
+                    elif r["state"] in ("done", "failed", "cancelled"):
+                        for path in r["outputs"]: self.job_log.emit(job_id, f"✔ {path}")
+                        if r["error"]: self.job_log.emit(job_id, r["error"])
+                        job["state"] = finished = r["state"]
+                if finished: self._finish_job(job_id, finished)
+            self._emit_overall()
+        if self.active and not self.is_busy():
+            self.active = False; self.all_finished.emit()
+
+    def _finish_job(self, job_id, state):
+        # 상태는 호출 전에 잠금 안에서 바꿔 둠. 여기서는 알림만 (슬롯이 같은 스레드에서 바로 불려도 잠금을 잡지 않음)
+        if state == "done":
+            with self.lock:
+                if job_id in self.jobs: self.jobs[job_id]["progress"] = 100
+            self.job_progress.emit(job_id, 100)
+        self.job_state.emit(job_id, state)
+        self._emit_overall()
+
+    def _emit_overall(self):
+        with self.lock: batch = [(j["state"], j["progress"]) for j in self.jobs.values()]
+        if not batch: return
+        total = sum(100 if state in ("done", "failed", "cancelled") else progress for state, progress in batch)
+        self.overall_progress.emit(int(total / len(batch)))
+
+# ==========================================
+# 2-2. ffmpeg 기능 탐지 (백그라운드, 결과는 디스크 캐시라 두 번째 실행부터는 즉시 끝남)
+# ==========================================
+class CapabilityProbe(QObject):
+    # QThread 대신 데몬 스레드: 보정 중에 창을 닫아도 종료를 기다리지 않음
+    probed_signal = pyqtSignal(object, object)  # (기능, auto 보정 결과 또는 None)
+
+    def __init__(self, ffmpeg_path, crf=None, refresh=False, parent=None):
+        super().__init__(parent)
+        self.ffmpeg_path, self.crf, self.refresh = ffmpeg_path, crf, refresh
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        caps = ffmpeg_capabilities(self.ffmpeg_path, refresh=self.refresh)
+        pick = calibrate_encoders(self.ffmpeg_path, self.crf) if caps and self.crf is not None else None
+        self.running = False
+        self.probed_signal.emit(caps, pick)
+
+# ==========================================
+# 3. 필터 미리보기 스레드 (디코딩/렌더링 모두 GUI 스레드 밖에서 실행)
+# ==========================================
+class PreviewLoader(QThread):
+    loaded_signal = pyqtSignal(str, object)
+
+    def __init__(self, ffmpeg_path, input_path):
+        super().__init__()
+        self.ffmpeg_path, self.input_path = ffmpeg_path, input_path
+
+    def run(self):
+        self.loaded_signal.emit(self.input_path, dme_numpy.decode_sample_frames(self.ffmpeg_path, self.input_path))
+
+class PreviewRenderer(QThread):
+    rendered_signal = pyqtSignal(object, object)
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        super().__init__()
+        self.cache = dme_numpy.LRUCache(max_bytes)  # (세대, 프레임, blur, sigmar, res_mode, 필터 사용) -> 결과
+        self.samples, self.generation = None, 0
+        self.pending, self.alive = None, True
+        self.cond = threading.Condition()
+
+    def set_samples(self, samples):
+        with self.cond:
+            self.samples = samples; self.generation += 1
+        self.cache.clear()
+
+    def request(self, frame_idx, use_filter, blur, sigmar, res_mode):
+        # 슬라이더를 빠르게 움직이면 마지막 요청만 남기고 버림
+        with self.cond:
+            self.pending = (self.generation, frame_idx, round(blur, 2) if use_filter else 0.0,
+                            round(sigmar, 3) if use_filter else 0.0, res_mode, use_filter)
+            self.cond.notify()
+            return self.pending
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and self.alive: self.cond.wait()
+                if not self.alive: return
+                key, self.pending = self.pending, None
+                samples = self.samples if key[0] == self.generation else None
+            if not samples or key[1] >= len(samples["frames"]): continue
+            img = self.cache.get(key)
+            if img is None:
+                _, frame = samples["frames"][key[1]]
+                img = dme_numpy.render_preview(frame, samples["src_size"], key[5], key[2], key[3], key[4])
+                self.cache.put(key, img)
+            self.rendered_signal.emit(key, img)
+
+    def shutdown(self):
+        with self.cond:
+            self.alive = False; self.cond.notify()
+        self.wait()
+
+# ==========================================
+# 4. 메인 GUI 클래스
 # ==========================================
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.current_lang = "EN"
-        self.worker = None
         self.config_file = "settings_single.json"
+        self.metrics_file = None
         self.ffmpeg_path = self.check_ffmpeg()
+        self.next_job_id = 0
+        self.batch_aborted = False
+        self.scheduler = self.local_scheduler = BatchScheduler(parent=self)
+        self.remote_scheduler, self.farm_token = None, None  # 원격 스케줄러는 Farm URL이 있을 때 만듦
+        self.caps, self.caps_probe, self.start_pending = None, None, False
+        self.preview_loader, self.preview_key = None, None
+        self.preview_renderer = PreviewRenderer()
         
         self.texts = {
             "KO": {
@@ -132,7 +381,14 @@ class MainWindow(QMainWindow):
                 "resolution": "해상도:", "res_orig": "원본", "gblur": "G 블러:",
                 "sigmar": "Sigma R:", "auto_balance": "자동 밸런스", "enc_group": "인코딩 엔진",
                 "format": "포맷:", "codec": "코덱:", "quality": "품질(CRF/CQ):", "preset": "프리셋:",
-                "start": "변환 시작", "stop": "중단", "finish_msg": "변환이 완료되었습니다.", "err_ffmpeg": "FFmpeg가 없습니다."
+                "start": "변환 시작", "stop": "중단", "finish_msg": "변환이 완료되었습니다.", "err_ffmpeg": "FFmpeg가 없습니다.",
+                "queue_group": "작업 대기열", "add_files": "파일 추가", "add_folder": "폴더 추가", "remove": "목록에서 제거",
+                "cancel_job": "선택 작업 취소", "jobs": "동시 작업:", "jobs_auto": "자동", "segments": "구간 분할:", "seg_off": "사용 안 함",
+                "planner": "필터 순서:", "plan_exact": "정확 (원본 해상도에서 필터)", "plan_fast": "빠름 (먼저 축소 후 필터, 흑백 처리)", "engine": "필터 엔진:", "cache": "같은 결과가 있으면 재사용", "profile": "실행 기록 저장", "farm": "분산 처리:", "redetect": "인코더 다시 확인", "sweep": "변형 스윕:", "err_sweep": "변형 스윕 형식 오류",
+                "preview_group": "미리보기", "preview_load": "불러오기", "preview_none": "미리볼 영상이 없습니다.",
+                "preview_loading": "샘플 프레임 디코딩 중...", "preview_numpy": "미리보기에는 numpy가 필요합니다.",
+                "col_file": "파일", "col_state": "상태", "col_progress": "진행률", "col_speed": "속도 / 남은 시간",
+                "idle": "대기", "queued": "예약됨", "running": "처리 중", "done": "완료", "failed": "실패", "cancelled": "취소됨"
             },
             "EN": {
                 "title": "Depth Map Extract (DME) v1.0",
@@ -141,23 +397,42 @@ class MainWindow(QMainWindow):
                 "resolution": "Res:", "res_orig": "Original", "gblur": "G-Blur:",
                 "sigmar": "Sigma R:", "auto_balance": "Auto Balance", "enc_group": "Engine",
                 "format": "Format:", "codec": "Codec:", "quality": "Quality:", "preset": "Preset:",
-                "start": "Start", "stop": "Stop", "finish_msg": "Conversion complete.", "err_ffmpeg": "FFmpeg not found."
+                "start": "Start", "stop": "Stop", "finish_msg": "Conversion complete.", "err_ffmpeg": "FFmpeg not found.",
+                "queue_group": "Job Queue", "add_files": "Add Files", "add_folder": "Add Folder", "remove": "Remove",
+                "cancel_job": "Cancel Selected", "jobs": "Parallel Jobs:", "jobs_auto": "Auto", "segments": "Segments:", "seg_off": "Off",
+                "planner": "Filter Plan:", "plan_exact": "Exact (filter at source resolution)", "plan_fast": "Fast (scale first, gray processing)", "engine": "Filter Engine:", "cache": "Reuse identical outputs", "profile": "Save run profile", "farm": "Farm:", "redetect": "Re-detect encoders", "sweep": "Sweep:", "err_sweep": "Invalid sweep",
+                "preview_group": "Preview", "preview_load": "Load", "preview_none": "No video to preview.",
+                "preview_loading": "Decoding sample frames...", "preview_numpy": "Preview requires numpy.",
+                "col_file": "File", "col_state": "Status", "col_progress": "Progress", "col_speed": "Speed / ETA",
+                "idle": "Idle", "queued": "Queued", "running": "Running", "done": "Done", "failed": "Failed", "cancelled": "Cancelled"
             }
         }
 
         self.init_ui()
+        self.connect_scheduler(self.local_scheduler)
+        self.log_buffer = []
+        self.log_timer = QTimer(self); self.log_timer.timeout.connect(self.flush_log); self.log_timer.start(200)
+        self.preview_renderer.rendered_signal.connect(self.on_preview_rendered)
+        self.preview_renderer.start()
         self.load_settings() # 설정 파일 로드
         self.retranslate_ui()
+        self.plan_combo.setCurrentIndex(max(self.plan_combo.findData(getattr(self, "plan_mode_saved", "exact")), 0))
         self.toggle_filter_ui(self.use_filter_check.isChecked())
+        self.probe_capabilities()  # 시작을 막지 않도록 백그라운드에서 탐지
+
+    def connect_scheduler(self, scheduler):
+        scheduler.job_progress.connect(self.on_job_progress)
+        scheduler.job_stats.connect(self.on_job_stats)
+        scheduler.job_log.connect(self.on_job_log)
+        scheduler.job_state.connect(self.on_job_state)
+        scheduler.overall_progress.connect(self.progress_bar.setValue)
+        scheduler.all_finished.connect(self.on_finished)
 
     def check_ffmpeg(self):
-        local_path = os.path.join(os.getcwd(), "ffmpeg.exe")
-        if os.path.exists(local_path): return local_path
-        sys_path = shutil.which("ffmpeg")
-        return sys_path if sys_path else None
+        return find_ffmpeg()
 
     def init_ui(self):
-        self.setGeometry(100, 100, 950, 750)
+        self.setGeometry(100, 100, 950, 900)
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         main_layout = QVBoxLayout(central_widget)
@@ -179,6 +454,29 @@ class MainWindow(QMainWindow):
         self.output_btn = QPushButton(); self.output_btn.clicked.connect(self.select_output); path_layout.addWidget(self.output_btn, 1, 2)
         self.input_group.setLayout(path_layout); main_layout.addWidget(self.input_group)
 
+        self.queue_group = QGroupBox()
+        queue_layout = QVBoxLayout()
+        self.queue_table = QTableWidget(0, 4)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.queue_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.queue_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.queue_table.verticalHeader().setVisible(False); self.queue_table.setMinimumHeight(120)
+        queue_layout.addWidget(self.queue_table)
+        queue_btns = QHBoxLayout()
+        self.add_files_btn = QPushButton(); self.add_files_btn.clicked.connect(self.add_files)
+        self.add_folder_btn = QPushButton(); self.add_folder_btn.clicked.connect(self.add_folder)
+        self.remove_btn = QPushButton(); self.remove_btn.clicked.connect(self.remove_selected)
+        self.cancel_job_btn = QPushButton(); self.cancel_job_btn.clicked.connect(self.cancel_selected)
+        [queue_btns.addWidget(b) for b in [self.add_files_btn, self.add_folder_btn, self.remove_btn, self.cancel_job_btn]]
+        queue_btns.addStretch()
+        self.lbl_farm = QLabel(); queue_btns.addWidget(self.lbl_farm)
+        self.farm_edit = QLineEdit(); self.farm_edit.setPlaceholderText("http://host:8765"); queue_btns.addWidget(self.farm_edit)
+        self.lbl_jobs = QLabel(); queue_btns.addWidget(self.lbl_jobs)
+        self.jobs_spin = QSpinBox(); self.jobs_spin.setRange(0, max(8, os.cpu_count() or 1)); queue_btns.addWidget(self.jobs_spin)
+        self.jobs_spin.valueChanged.connect(lambda: self.scheduler.set_max_workers(self.current_jobs()) if self.scheduler.is_busy() else None)
+        queue_layout.addLayout(queue_btns)
+        self.queue_group.setLayout(queue_layout); main_layout.addWidget(self.queue_group)
+
         self.filter_group = QGroupBox()
         filter_layout = QGridLayout()
         self.use_filter_check = QCheckBox(); self.use_filter_check.toggled.connect(self.toggle_filter_ui)
@@ -200,20 +498,50 @@ class MainWindow(QMainWindow):
         self.sigmar_slider = QSlider(Qt.Orientation.Horizontal); self.sigmar_slider.setRange(0, 40); filter_layout.addWidget(self.sigmar_slider, 2, 1)
         self.sigmar_spin = QDoubleSpinBox(); self.sigmar_spin.setRange(0.000, 0.040); self.sigmar_spin.setDecimals(3); filter_layout.addWidget(self.sigmar_spin, 2, 2)
         self.auto_check = QCheckBox(); self.auto_check.toggled.connect(self.toggle_auto_mode); filter_layout.addWidget(self.auto_check, 2, 3)
-        self.filter_group.setLayout(filter_layout); main_layout.addWidget(self.filter_group)
+        self.lbl_plan = QLabel(); filter_layout.addWidget(self.lbl_plan, 3, 0)
+        self.plan_combo = QComboBox(); filter_layout.addWidget(self.plan_combo, 3, 1)
+        self.lbl_engine = QLabel(); filter_layout.addWidget(self.lbl_engine, 3, 2)
+        self.engine_combo = QComboBox(); self.engine_combo.addItems(ENGINES); filter_layout.addWidget(self.engine_combo, 3, 3)
+        self.filter_group.setLayout(filter_layout)
+
+        self.preview_group = QGroupBox()
+        preview_layout = QVBoxLayout()
+        self.preview_label = QLabel(); self.preview_label.setMinimumSize(240, 180)
+        self.preview_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)  # 픽스맵 크기로 창이 커지지 않게
+        self.preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.preview_label.setStyleSheet("background-color: #1e1e1e; color: #888888;")
+        preview_layout.addWidget(self.preview_label)
+        preview_ctrl = QHBoxLayout()
+        self.preview_slider = QSlider(Qt.Orientation.Horizontal); self.preview_slider.setRange(0, 0)
+        self.preview_slider.valueChanged.connect(self.request_preview); preview_ctrl.addWidget(self.preview_slider)
+        self.preview_btn = QPushButton(); self.preview_btn.clicked.connect(self.load_preview); preview_ctrl.addWidget(self.preview_btn)
+        preview_layout.addLayout(preview_ctrl)
+        self.preview_group.setLayout(preview_layout)
+
+        filter_row = QHBoxLayout(); filter_row.addWidget(self.filter_group, 3); filter_row.addWidget(self.preview_group, 2)
+        main_layout.addLayout(filter_row)
 
         self.enc_group = QGroupBox()
         enc_layout = QGridLayout()
         self.lbl_fmt = QLabel(); enc_layout.addWidget(self.lbl_fmt, 0, 0)
-        self.ext_combo = QComboBox(); self.ext_combo.addItems(["mp4", "mkv", "ts"]); enc_layout.addWidget(self.ext_combo, 0, 1)
+        self.ext_combo = QComboBox(); self.ext_combo.addItems(["mp4", "mkv", "ts"] + list(EXPORT_EXTS)); enc_layout.addWidget(self.ext_combo, 0, 1)
         self.lbl_cdc = QLabel(); enc_layout.addWidget(self.lbl_cdc, 0, 2)
-        self.codec_combo = QComboBox(); self.codec_combo.addItems(["libx265", "libx264", "hevc_nvenc"])
+        self.codec_combo = QComboBox(); self.codec_combo.addItems(["auto"] + list(CODEC_PRESETS))  # 탐지가 끝나면 실제로 되는 코덱만 남김
         self.codec_combo.currentTextChanged.connect(self.update_presets) # 코덱 변경시 프리셋 갱신
         enc_layout.addWidget(self.codec_combo, 0, 3)
         self.lbl_qty = QLabel(); enc_layout.addWidget(self.lbl_qty, 1, 0)
         self.crf_spin = QDoubleSpinBox(); self.crf_spin.setRange(0, 51); self.crf_spin.setDecimals(0); enc_layout.addWidget(self.crf_spin, 1, 1)
         self.lbl_pst = QLabel(); enc_layout.addWidget(self.lbl_pst, 1, 2)
         self.preset_combo = QComboBox(); enc_layout.addWidget(self.preset_combo, 1, 3)
+        self.lbl_seg = QLabel(); enc_layout.addWidget(self.lbl_seg, 2, 0)
+        self.seg_spin = QSpinBox(); self.seg_spin.setRange(0, 64); enc_layout.addWidget(self.seg_spin, 2, 1)
+        self.cache_check = QCheckBox(); self.cache_check.setChecked(True); enc_layout.addWidget(self.cache_check, 2, 2, 1, 2)
+        self.lbl_sweep = QLabel(); enc_layout.addWidget(self.lbl_sweep, 3, 0)
+        self.sweep_edit = QLineEdit(); self.sweep_edit.setPlaceholderText("blur=0.8,res=518; blur=1.0,sigmar=auto,res=392")
+        enc_layout.addWidget(self.sweep_edit, 3, 1, 1, 3)
+        self.caps_btn = QPushButton(); self.caps_btn.clicked.connect(lambda: self.probe_capabilities(refresh=True))
+        enc_layout.addWidget(self.caps_btn, 4, 0, 1, 2)  # NVENC 세션 한도 등 일시적 실패 후 다시 확인
+        self.profile_check = QCheckBox(); enc_layout.addWidget(self.profile_check, 4, 2, 1, 2)
         self.enc_group.setLayout(enc_layout); main_layout.addWidget(self.enc_group)
 
         self.progress_bar = QProgressBar(); main_layout.addWidget(self.progress_bar)
@@ -235,16 +563,59 @@ class MainWindow(QMainWindow):
         self.blur_spin.valueChanged.connect(self.sync_blur_from_spin)
         self.sigmar_slider.valueChanged.connect(self.sync_sigmar_from_slider)
         self.sigmar_spin.valueChanged.connect(self.sync_sigmar_from_spin)
+        # 값 동기화(sync_*)가 끝난 뒤 미리보기를 갱신하도록 나중에 연결
+        for w in [self.blur_slider, self.blur_spin, self.sigmar_slider, self.sigmar_spin]: w.valueChanged.connect(self.request_preview)
+        self.use_filter_check.toggled.connect(self.request_preview); self.auto_check.toggled.connect(self.request_preview)
+        self.res_group.buttonToggled.connect(self.request_preview)
 
     def update_presets(self):
         current_codec = self.codec_combo.currentText()
         self.preset_combo.clear()
-        if "nvenc" in current_codec:
-            presets = ["p1", "p2", "p3", "p4", "p5", "p6", "p7", "fast", "medium", "slow"]
-            self.preset_combo.addItems(presets)
-        else:
-            presets = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
-            self.preset_combo.addItems(presets)
+        if current_codec == "auto": self.preset_combo.addItem("auto"); return  # 보정 결과의 프리셋 사용
+        presets = (self.caps or {}).get("presets", {}).get(current_codec) or CODEC_PRESETS.get(current_codec, X26X_PRESETS)
+        self.preset_combo.addItems(presets)
+
+    def probe_capabilities(self, crf=None, refresh=False):
+        if not self.ffmpeg_path or (self.caps_probe and self.caps_probe.running): return
+        if refresh: self.log_text.append("Re-detecting FFmpeg encoders...")
+        self.caps_probe = CapabilityProbe(self.ffmpeg_path, crf, refresh, parent=self)
+        self.caps_probe.probed_signal.connect(self.on_caps_probed)
+
+    def on_caps_probed(self, caps, pick):
+        if caps: self.apply_caps(caps)
+        if not self.start_pending: return
+        if pick is None and caps and caps["encoders"] and self.sender().crf is None:
+            self.probe_capabilities(int(self.crf_spin.value())); return
+        self.start_pending = False; self.start_btn.setEnabled(True)
+        if not pick:
+            QMessageBox.critical(self, "Error", "No usable encoder found for codec 'auto'."); return
+        self.start_encoding()
+
+    def apply_caps(self, caps):
+        # 이 ffmpeg에서 실제로 되는 코덱/프리셋만 표시. 필수 필터가 없으면 필터 옵션을 끔
+        if not caps.get("listed"):
+            self.log_text.append("Could not read the encoder list from FFmpeg; keeping the default codec list."); return
+        self.caps = caps
+        codec, preset = self.codec_combo.currentText(), self.preset_combo.currentText()
+        # 시험 인코딩만 실패한 코덱(세션 한도 등)이 선택돼 있으면 목록에 남기고 경고만
+        failed = codec in caps.get("failed", [])
+        codecs = caps["encoders"] + ([codec] if failed else [])
+        self.codec_combo.blockSignals(True); self.codec_combo.clear()
+        self.codec_combo.addItems(["auto"] + codecs)
+        self.codec_combo.setCurrentText(codec if codec in codecs else "auto")
+        self.codec_combo.blockSignals(False)
+        self.update_presets()
+        if self.preset_combo.findText(preset) >= 0: self.preset_combo.setCurrentText(preset)
+        if failed: self.log_text.append(f"{codec} failed a test encode; it may not work on this PC.")
+        missing = [f for f in ("gblur", "bilateral") if f not in caps["filters"]]
+        self.use_filter_check.setEnabled(not missing)
+        if missing:
+            self.use_filter_check.setChecked(False)
+            self.log_text.append(f"FFmpeg has no {', '.join(missing)} filter; filtering disabled.")
+
+    def auto_pick(self):
+        caps = cached_capabilities(self.ffmpeg_path)
+        return caps["calibration"].get(str(int(self.crf_spin.value()))) if caps else None
 
     def sync_blur_from_slider(self, v):
         self.blur_spin.blockSignals(True); self.blur_spin.setValue(v/100.0); self.blur_spin.blockSignals(False)
@@ -262,14 +633,9 @@ class MainWindow(QMainWindow):
 
     def update_sigmar_balance(self):
         if self.auto_check.isChecked() and self.use_filter_check.isChecked():
-            bv = self.blur_spin.value()
-            if bv <= 0.6: sv = 0.020
-            elif bv <= 0.8: sv = 0.020 + (bv - 0.6) * 0.03
-            elif bv <= 1.0: sv = 0.026 + (bv - 0.8) * 0.035
-            elif bv <= 1.2: sv = 0.033 + (bv - 1.0) * 0.035
-            else: sv = 0.040
+            sv = auto_sigmar(self.blur_spin.value())
             self.sigmar_spin.blockSignals(True); self.sigmar_slider.blockSignals(True)
-            self.sigmar_spin.setValue(round(sv, 3)); self.sigmar_slider.setValue(int(round(sv, 3)*1000))
+            self.sigmar_spin.setValue(sv); self.sigmar_slider.setValue(int(sv*1000))
             self.sigmar_spin.blockSignals(False); self.sigmar_slider.blockSignals(False)
 
     def retranslate_ui(self):
@@ -281,10 +647,59 @@ class MainWindow(QMainWindow):
         self.auto_check.setText(t["auto_balance"]); self.enc_group.setTitle(t["enc_group"]); self.lbl_fmt.setText(t["format"])
         self.lbl_cdc.setText(t["codec"]); self.lbl_qty.setText(t["quality"]); self.lbl_pst.setText(t["preset"])
         self.start_btn.setText(t["start"]); self.stop_btn.setText(t["stop"])
+        self.queue_group.setTitle(t["queue_group"]); self.add_files_btn.setText(t["add_files"]); self.add_folder_btn.setText(t["add_folder"])
+        self.remove_btn.setText(t["remove"]); self.cancel_job_btn.setText(t["cancel_job"])
+        self.lbl_farm.setText(t["farm"]); self.lbl_jobs.setText(t["jobs"]); self.jobs_spin.setSpecialValueText(t["jobs_auto"])
+        self.lbl_seg.setText(t["segments"]); self.seg_spin.setSpecialValueText(t["seg_off"])
+        self.lbl_plan.setText(t["planner"]); self.lbl_engine.setText(t["engine"]); self.cache_check.setText(t["cache"])
+        self.lbl_sweep.setText(t["sweep"]); self.profile_check.setText(t["profile"]); self.caps_btn.setText(t["redetect"])
+        self.preview_group.setTitle(t["preview_group"]); self.preview_btn.setText(t["preview_load"])
+        plan_idx = max(self.plan_combo.currentIndex(), 0); self.plan_combo.clear()
+        for mode in PLAN_MODES: self.plan_combo.addItem(t[f"plan_{mode}"], mode)
+        self.plan_combo.setCurrentIndex(plan_idx)
+        self.queue_table.setHorizontalHeaderLabels([t["col_file"], t["col_state"], t["col_progress"], t["col_speed"]])
+        for r in range(self.queue_table.rowCount()):
+            state = self.queue_table.item(r, 1).data(Qt.ItemDataRole.UserRole)
+            self.queue_table.item(r, 1).setText(t[state])
 
     def select_input(self):
         f, _ = QFileDialog.getOpenFileName(self, "Select Video", "", "Videos (*.mp4 *.mkv *.ts)")
-        if f: self.input_edit.setText(f)
+        if f: self.input_edit.setText(f); self.load_preview()
+
+    # ---- 필터 미리보기 ----
+    def load_preview(self):
+        t = self.texts[self.current_lang]
+        rows = self.selected_rows()
+        path = self.queue_table.item(rows[0], 0).data(Qt.ItemDataRole.UserRole + 1) if rows else self.input_edit.text()
+        if dme_numpy.np is None: self.preview_label.setText(t["preview_numpy"]); return
+        self.ffmpeg_path = self.ffmpeg_path or self.check_ffmpeg()
+        if not path or not os.path.isfile(path) or not self.ffmpeg_path: self.preview_label.setText(t["preview_none"]); return
+        if self.preview_loader and self.preview_loader.isRunning(): return
+        self.preview_label.setText(t["preview_loading"])
+        self.preview_loader = PreviewLoader(self.ffmpeg_path, path)
+        self.preview_loader.loaded_signal.connect(self.on_preview_loaded)
+        self.preview_loader.start()
+
+    def on_preview_loaded(self, path, samples):
+        if not samples:
+            self.preview_label.setText(self.texts[self.current_lang]["preview_none"]); return
+        self.preview_renderer.set_samples(samples)
+        self.preview_slider.setRange(0, len(samples["frames"]) - 1)
+        self.preview_group.setToolTip(path)
+        self.request_preview()
+
+    def request_preview(self, *_):
+        if self.preview_renderer.samples is None: return
+        self.preview_key = self.preview_renderer.request(
+            self.preview_slider.value(), self.use_filter_check.isChecked(),
+            self.blur_spin.value(), self.sigmar_spin.value(), self.current_res_mode())
+
+    def on_preview_rendered(self, key, img):
+        if key != self.preview_key: return  # 이미 더 새로운 요청이 있음
+        h, w = img.shape
+        qimg = QImage(img.data, w, h, w, QImage.Format.Format_Grayscale8).copy()
+        self.preview_label.setPixmap(QPixmap.fromImage(qimg).scaled(
+            self.preview_label.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
 
     def select_output(self):
         d = QFileDialog.getExistingDirectory(self, "Select Output Folder")
@@ -300,61 +715,181 @@ class MainWindow(QMainWindow):
             self.sigmar_slider.setEnabled(not c); self.sigmar_spin.setEnabled(not c)
             if c: self.update_sigmar_balance()
 
-    def start_encoding(self):
-        self.ffmpeg_path = self.check_ffmpeg()
-        if not self.ffmpeg_path: QMessageBox.critical(self, "Error", self.texts[self.current_lang]["err_ffmpeg"]); return
-        if not self.input_edit.text() or not self.output_edit.text():
-            QMessageBox.warning(self, "Warning", "Please select input file and output folder."); return
-
-        res_val = "none"
-        if self.res_518.isChecked(): res_val = "518"
-        elif self.res_512.isChecked(): res_val = "512"
-        elif self.res_504.isChecked(): res_val = "504"
-        elif self.res_392.isChecked(): res_val = "392"
-
+    # ---- 작업 대기열 ----
+    def add_files(self):
+        files, _ = QFileDialog.getOpenFileNames(self, "Select Videos", "", "Videos (*.mp4 *.mkv *.ts)")
+        self.enqueue_files(files)
+
+    def add_folder(self):
+        d = QFileDialog.getExistingDirectory(self, "Select Input Folder")
+        if d: self.enqueue_files(collect_inputs([d]))
+
+    def enqueue_files(self, files):
+        for f in files:
+            job_id = self.next_job_id; self.next_job_id += 1
+            r = self.queue_table.rowCount(); self.queue_table.insertRow(r)
+            name_item = QTableWidgetItem(os.path.basename(f)); name_item.setToolTip(f)
+            name_item.setData(Qt.ItemDataRole.UserRole, job_id); name_item.setData(Qt.ItemDataRole.UserRole + 1, f)
+            self.queue_table.setItem(r, 0, name_item)
+            self.queue_table.setItem(r, 1, QTableWidgetItem())
+            bar = QProgressBar(); bar.setValue(0); self.queue_table.setCellWidget(r, 2, bar)
+            self.queue_table.setItem(r, 3, QTableWidgetItem())
+            self.set_row_state(r, "idle")
+            # 실행 중에 추가된 파일은 현재 설정으로 바로 대기열에 넣음
+            if self.scheduler.is_busy(): self.submit_row(r)
+
+    def row_of(self, job_id):
+        for r in range(self.queue_table.rowCount()):
+            if self.queue_table.item(r, 0).data(Qt.ItemDataRole.UserRole) == job_id: return r
+        return -1
+
+    def set_row_state(self, r, state):
+        item = self.queue_table.item(r, 1)
+        item.setData(Qt.ItemDataRole.UserRole, state); item.setText(self.texts[self.current_lang][state])
+
+    def selected_rows(self):
+        return sorted({i.row() for i in self.queue_table.selectedIndexes()})
+
+    def remove_selected(self):
+        for r in reversed(self.selected_rows()):
+            if self.queue_table.item(r, 1).data(Qt.ItemDataRole.UserRole) in ("queued", "running"): continue
+            self.queue_table.removeRow(r)
+
+    def cancel_selected(self):
+        for r in self.selected_rows():
+            self.scheduler.cancel(self.queue_table.item(r, 0).data(Qt.ItemDataRole.UserRole))
+
+    def current_jobs(self):
+        codec = self.codec_combo.currentText()
+        pick = self.auto_pick() if codec == "auto" else None
+        return self.jobs_spin.value() or (pick["jobs"] if pick else default_concurrency(codec))
+
+    def current_res_mode(self):
+        if self.res_518.isChecked(): return "518"
+        elif self.res_512.isChecked(): return "512"
+        elif self.res_504.isChecked(): return "504"
+        elif self.res_392.isChecked(): return "392"
+        return "none"
+
+    def build_params(self, input_path):
         params = {
-            'input_path': self.input_edit.text(), 'output_folder': self.output_edit.text(),
+            'input_path': input_path, 'output_folder': self.output_edit.text(),
             'ffmpeg_path': self.ffmpeg_path, 'use_filter': self.use_filter_check.isChecked(),
-            'res_mode': res_val, 'aspect_ratio': "NONE",
+            'res_mode': self.current_res_mode(), 'aspect_ratio': "NONE",
             'blur': self.blur_spin.value(), 'sigmar': self.sigmar_spin.value(),
             'ext': self.ext_combo.currentText(), 'codec': self.codec_combo.currentText(), 
-            'crf': int(self.crf_spin.value()), 'preset': self.preset_combo.currentText()
+            'crf': int(self.crf_spin.value()), 'preset': self.preset_combo.currentText(),
+            'segments': self.seg_spin.value(), 'plan_mode': self.plan_combo.currentData() or "exact",
+            'engine': self.engine_combo.currentText(), 'cache': self.cache_check.isChecked(),
+            'profile': self.profile_check.isChecked(), 'metrics_file': self.metrics_file
         }
+        # 변형이 있으면 한 번 디코딩해서 여러 출력을 만드는 스윕 작업
+        if self.sweep_edit.text().strip(): params['variants'] = parse_variants(self.sweep_edit.text(), params)
+        return params
+
+    def submit_row(self, r):
+        item = self.queue_table.item(r, 0)
+        self.queue_table.cellWidget(r, 2).setValue(0)
+        self.scheduler.submit(item.data(Qt.ItemDataRole.UserRole), self.build_params(item.data(Qt.ItemDataRole.UserRole + 1)))
+
+    def on_job_progress(self, job_id, v):
+        r = self.row_of(job_id)
+        if r >= 0: self.queue_table.cellWidget(r, 2).setValue(v)
+
+    def on_job_stats(self, job_id, st):
+        r = self.row_of(job_id)
+        if r < 0: return
+        parts = []
+        if st.get("fps"): parts.append(f"{st['fps']:.1f} fps")
+        if st.get("speed"): parts.append(f"{st['speed']:.2f}x")
+        parts.append(f"ETA {format_eta(st.get('eta'))}")
+        self.queue_table.item(r, 3).setText(" · ".join(parts))
+
+    def on_job_state(self, job_id, state):
+        r = self.row_of(job_id)
+        if r >= 0: self.set_row_state(r, state)
+
+    def on_job_log(self, job_id, msg):
+        self.log_buffer.append(f"[#{job_id + 1}] {msg}")
+
+    def flush_log(self):
+        # 여러 작업의 로그를 모아 한 번에 추가 (QTextEdit 재그리기 횟수 제한)
+        if not self.log_buffer: return
+        lines, self.log_buffer = self.log_buffer, []
+        self.log_text.setUpdatesEnabled(False)
+        for line in lines: self.log_text.append(line)
+        self.log_text.setUpdatesEnabled(True)
+
+    def start_encoding(self):
+        # 처음 찾은 ffmpeg를 계속 사용 (지워졌을 때만 다시 찾음)
+        if not self.ffmpeg_path or not os.path.exists(self.ffmpeg_path): self.ffmpeg_path = self.check_ffmpeg(); self.caps = None
+        if not self.ffmpeg_path: QMessageBox.critical(self, "Error", self.texts[self.current_lang]["err_ffmpeg"]); return
+        rows = [r for r in range(self.queue_table.rowCount())
+                if self.queue_table.item(r, 1).data(Qt.ItemDataRole.UserRole) in ("idle", "failed", "cancelled")]
+        # 대기열이 비어 있으면 기존처럼 입력 파일 하나를 처리
+        if not rows and self.input_edit.text():
+            self.enqueue_files([self.input_edit.text()]); rows = [self.queue_table.rowCount() - 1]
+        if not rows or not self.output_edit.text():
+            QMessageBox.warning(self, "Warning", "Please select input file and output folder."); return
+        try: parse_variants(self.sweep_edit.text(), {'blur': self.blur_spin.value(), 'codec': self.codec_combo.currentText(),
+                                                     'preset': self.preset_combo.currentText()})
+        except ValueError as e: QMessageBox.warning(self, "Warning", f"{self.texts[self.current_lang]['err_sweep']}: {e}"); return
+        # auto: 이 품질값의 보정 결과가 없으면 백그라운드에서 측정한 뒤 다시 시작 (원격 작업은 작업자 노드가 측정)
+        if self.codec_combo.currentText() == "auto" and not self.farm_edit.text().strip() and not self.auto_pick():
+            self.start_pending = True; self.start_btn.setEnabled(False)
+            self.log_text.append("Calibrating encoders for 'auto'...")
+            self.probe_capabilities(int(self.crf_spin.value()))  # 기본 탐지가 진행 중이면 끝난 뒤 이어서 보정
+            return
 
         self.start_btn.setEnabled(False); self.stop_btn.setEnabled(True)
-        self.log_text.clear(); self.progress_bar.setValue(0)
-        self.worker = EncoderWorker(params)
-        self.worker.log_signal.connect(self.log_text.append)
-        self.worker.progress_signal.connect(self.progress_bar.setValue)
-        self.worker.finished_signal.connect(self.on_finished)
-        self.worker.error_signal.connect(lambda e: [QMessageBox.critical(self, "Error", e), self.on_finished()])
-        self.worker.start()
+        self.log_text.clear(); self.log_buffer = []; self.progress_bar.setValue(0)
+        self.batch_aborted = False
+        self.scheduler = self.farm_scheduler() or self.local_scheduler
+        self.scheduler.reset(); self.scheduler.set_max_workers(self.current_jobs())
+        if self.scheduler is self.local_scheduler: self.log_text.append(f"Jobs: {len(rows)} / Parallel: {self.scheduler.max_workers}")
+        else: self.log_text.append(f"Jobs: {len(rows)} / Farm: {self.farm_edit.text().strip()}")
+        pick = self.auto_pick() if self.codec_combo.currentText() == "auto" and self.scheduler is self.local_scheduler else None
+        if pick: self.log_text.append(f"Auto encoder: {pick['codec']} ({pick['preset']}) / " + ", ".join(f"{c} {v} fps" for c, v in pick["fps"].items()))
+        for r in rows: self.submit_row(r)
+
+    def farm_scheduler(self):
+        # Farm URL이 있으면 코디네이터로 제출 (URL이 바뀌면 새로 연결)
+        url = self.farm_edit.text().strip()
+        if not url: return None
+        if self.remote_scheduler is None or self.remote_scheduler.client.url != url.rstrip("/"):
+            if self.remote_scheduler: self.remote_scheduler.shutdown()
+            self.remote_scheduler = RemoteScheduler(FarmClient(url, self.farm_token), parent=self)
+            self.connect_scheduler(self.remote_scheduler)
+        return self.remote_scheduler
 
     def stop_encoding(self):
-        if self.worker:
-            self.worker.stop()
-            self.log_text.append("<span style='color:red;'><b>🛑 Aborted.</b></span>")
-            self.on_finished()
+        if self.scheduler.is_busy():
+            self.batch_aborted = True
+            self.scheduler.stop_all()
+            self.flush_log(); self.log_text.append("<span style='color:red;'><b>🛑 Aborted.</b></span>")
 
     def on_finished(self):
+        self.flush_log()
         self.start_btn.setEnabled(True); self.stop_btn.setEnabled(False)
-        if self.worker and self.worker.is_running and self.progress_bar.value() >= 100:
+        states = [j["state"] for j in self.scheduler.jobs.values()]
+        if not self.batch_aborted and states and all(st == "done" for st in states):
             QMessageBox.information(self, "Done", self.texts[self.current_lang]["finish_msg"])
-        self.worker = None
+        elif "failed" in states:
+            QMessageBox.critical(self, "Error", f"{states.count('failed')} / {len(states)} job(s) failed. See log.")
         self.save_settings()
 
     def save_settings(self):
-        res_val = "none"
-        if self.res_518.isChecked(): res_val = "518"
-        elif self.res_512.isChecked(): res_val = "512"
-        elif self.res_504.isChecked(): res_val = "504"
-        elif self.res_392.isChecked(): res_val = "392"
-
+        res_val = self.current_res_mode()
         s = {"lang": self.current_lang, "input": self.input_edit.text(), "output": self.output_edit.text(),
              "use_filter": self.use_filter_check.isChecked(), "res_mode": res_val,
              "aspect": "NONE", "blur": self.blur_spin.value(), "sigmar": self.sigmar_spin.value(), "auto": self.auto_check.isChecked(),
              "ext": self.ext_combo.currentText(), "codec": self.codec_combo.currentText(), "crf": self.crf_spin.value(), 
-             "preset": self.preset_combo.currentText()} # 프리셋 저장
+             "preset": self.preset_combo.currentText(), "jobs": self.jobs_spin.value(),
+             "segments": self.seg_spin.value(), "plan_mode": self.plan_combo.currentData(),
+             "engine": self.engine_combo.currentText(), "cache": self.cache_check.isChecked(),
+             "sweep": self.sweep_edit.text(), "profile": self.profile_check.isChecked(),
+             "metrics_file": self.metrics_file, "farm_url": self.farm_edit.text(),
+             "farm_token": self.farm_token} # 프리셋 저장
         with open(self.config_file, 'w') as f: json.dump(s, f)
 
     def load_settings(self):
@@ -392,11 +927,24 @@ class MainWindow(QMainWindow):
                 self.preset_combo.setCurrentText(saved_preset)
             
             self.crf_spin.setValue(d.get("crf", 18))
+            self.jobs_spin.setValue(d.get("jobs", 0))
+            self.seg_spin.setValue(d.get("segments", 0))
+            self.plan_mode_saved = d.get("plan_mode", "exact")
+            self.engine_combo.setCurrentText(d.get("engine", "ffmpeg"))
+            self.cache_check.setChecked(d.get("cache", True))
+            self.sweep_edit.setText(d.get("sweep", ""))
+            self.profile_check.setChecked(d.get("profile", False))
+            self.metrics_file = d.get("metrics_file")  # Prometheus 지표 파일 (설정 파일에서만 지정)
+            self.farm_edit.setText(d.get("farm_url", "")); self.farm_token = d.get("farm_token")
         except: 
             self.btn_lang_en.setChecked(True)
             self.update_presets()
 
-    def closeEvent(self, e): self.save_settings(); e.accept()
+    def closeEvent(self, e):
+        # 분산 작업은 코디네이터에서 계속 진행되므로 진행 상황 조회만 멈춤
+        self.local_scheduler.stop_all()
+        if self.remote_scheduler: self.remote_scheduler.shutdown()
+        self.preview_renderer.shutdown(); self.save_settings(); e.accept()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv); app.setStyle(QStyleFactory.create("Fusion"))
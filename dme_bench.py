@@ -0,0 +1,174 @@
+import sys
+import os
+import csv
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import itertools
+from dme_core import find_ffmpeg, ffmpeg_version, ffmpeg_capabilities, CREATION_FLAGS, RES_MODES
+
+# ==========================================
+# DME 인코딩 벤치마크 (합성 SBS 깊이 영상으로 설정 조합별 처리량 측정)
+# ==========================================
+# 예: python dme_bench.py --json baseline.json --csv baseline.csv
+#     python dme_bench.py --baseline baseline.json --json new.json   (10% 이상 느려지면 종료 코드 1)
+
+CLI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dme_cli.py")
+DEFAULT_SWEEP = {
+    'codec': "libx264,libx265,hevc_nvenc", 'preset': "fast,medium", 'crf': "18",
+    'filter': "off,on", 'res': "none,518", 'engine': "ffmpeg"
+}
+METRICS = (("fps", -1), ("cpu_s", 1), ("rss_mb", 1), ("size_bytes", 1))  # -1: 낮아지면 회귀 / 1: 높아지면 회귀
+FIELDS = ("clip", "codec", "preset", "crf", "filter", "res", "engine", "ok", "frames",
+          "wall_s", "cpu_s", "fps", "rss_mb", "size_bytes")
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="dme-bench", description="Depth Map Extract (DME) - encode benchmark")
+    p.add_argument("--ffmpeg", help="path to ffmpeg binary (default: auto-detect)")
+    p.add_argument("--workdir", help="folder for generated clips and outputs (default: temp folder)")
+    p.add_argument("--clip-size", default="960x540", help="size of ONE eye; the clip is twice as wide (default 960x540)")
+    p.add_argument("--clip-seconds", type=float, default=5.0)
+    p.add_argument("--clip-fps", type=int, default=24)
+    for key, value in DEFAULT_SWEEP.items():
+        p.add_argument(f"--{key}", default=value, help=f"comma-separated values (default: {value})")
+    p.add_argument("--repeat", type=int, default=1, help="runs per case; the fastest run is kept")
+    p.add_argument("--json", help="write results (with run metadata) to this JSON file")
+    p.add_argument("--csv", help="write results to this CSV file")
+    p.add_argument("--baseline", help="previous --json result to compare against")
+    p.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression (default 0.10)")
+    return p
+
+def split_values(text): return [v.strip() for v in text.split(",") if v.strip()]
+
+def make_clip(ffmpeg_path, folder, size, seconds, fps):
+    # 왼쪽: testsrc2 컬러 영상 / 오른쪽: 회전 그라디언트 + 노이즈 깊이맵 (seed 고정 → 항상 같은 영상)
+    w, h = (int(v) for v in size.lower().split("x"))
+    name = f"sbs_{w * 2}x{h}_{fps}p_{seconds:g}s"
+    path = os.path.join(folder, name + ".mp4")
+    if os.path.exists(path): return name, path
+    graph = (f"testsrc2=s={w}x{h}:r={fps}:d={seconds}[l];"
+             f"gradients=s={w}x{h}:r={fps}:d={seconds}:c0=black:c1=white:seed=1:speed=0.02,"
+             f"format=gray,noise=alls=6:allf=t,format=yuv420p[r];[l][r]hstack")
+    cmd = [ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error", "-filter_complex", graph,
+           "-c:v", "libx264", "-preset", "ultrafast", "-crf", "12", "-pix_fmt", "yuv420p", path + ".part.mp4"]
+    subprocess.run(cmd, check=True, capture_output=True, creationflags=CREATION_FLAGS)
+    os.replace(path + ".part.mp4", path)
+    return name, path
+
+def build_cases(args, ffmpeg_path):
+    usable = ffmpeg_capabilities(ffmpeg_path)["encoders"]
+    codecs = [c for c in split_values(args.codec) if c in usable]
+    engines = split_values(args.engine)
+    if "numpy" in engines:
+        try: import numpy  # noqa: F401
+        except ImportError: engines.remove("numpy")
+    cases = []
+    for codec, preset, crf, flt, res, engine in itertools.product(
+            codecs, split_values(args.preset), split_values(args.crf), split_values(args.filter),
+            split_values(args.res), engines):
+        if engine == "numpy" and flt != "on": continue  # 필터가 없으면 numpy 엔진은 ffmpeg와 동일
+        cases.append({'codec': codec, 'preset': preset, 'crf': int(crf), 'filter': flt, 'res': res, 'engine': engine})
+    return cases
+
+def measure(cmd):
+    # wall / CPU(자식 ffmpeg 포함) / 최대 RSS. wait4가 없는 OS(Windows)는 wall 시간만 기록
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, creationflags=CREATION_FLAGS)
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        rss_kb = usage.ru_maxrss / 1024 if sys.platform == "darwin" else usage.ru_maxrss  # macOS는 바이트 단위
+        cpu, rss = usage.ru_utime + usage.ru_stime, rss_kb / 1024
+    else:
+        proc.wait(); cpu = rss = None
+    return proc.returncode, time.perf_counter() - start, cpu, rss
+
+def run_case(ffmpeg_path, clip, case, workdir, repeat):
+    best = None
+    for _ in range(max(1, repeat)):
+        out = tempfile.mkdtemp(prefix="out_", dir=workdir)
+        cmd = [sys.executable, CLI_PATH, clip['path'], "-o", out, "-q", "-j", "1", "--ffmpeg", ffmpeg_path,
+               "--codec", case['codec'], "--preset", case['preset'], "--crf", str(case['crf']),
+               "--res", case['res'], "--engine", case['engine'], "--no-cache", "--filter" if case['filter'] == "on" else "--no-filter"]
+        code, wall, cpu, rss = measure(cmd)
+        outputs = [os.path.join(out, f) for f in os.listdir(out)]
+        size = sum(os.path.getsize(f) for f in outputs)
+        for f in outputs: os.remove(f)
+        os.rmdir(out)
+        row = dict(case, clip=clip['name'], ok=code == 0 and size > 0, frames=clip['frames'],
+                   wall_s=round(wall, 3), cpu_s=None if cpu is None else round(cpu, 3),
+                   fps=round(clip['frames'] / wall, 2), rss_mb=None if rss is None else round(rss, 1), size_bytes=size)
+        if not row['ok']: return row
+        if best is None or row['wall_s'] < best['wall_s']: best = row
+    return best
+
+def case_key(row): return tuple(str(row[k]) for k in FIELDS[:7])
+
+def find_regressions(results, baseline, threshold):
+    base = {case_key(r): r for r in baseline.get("results", [])}
+    flags = []
+    for r in results:
+        b = base.get(case_key(r))
+        if b is None or not b['ok']: continue
+        if not r['ok']:
+            flags.append((r, "ok", True, False)); continue
+        for metric, direction in METRICS:
+            old, new = b.get(metric), r.get(metric)
+            if not old or new is None: continue
+            if (new - old) / old * direction > threshold: flags.append((r, metric, old, new))
+    return flags
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    ffmpeg_path = args.ffmpeg or find_ffmpeg()
+    if not ffmpeg_path:
+        print("FFmpeg not found.", file=sys.stderr); return 2
+    bad = [r for r in split_values(args.res) if r not in RES_MODES]
+    if bad:
+        print(f"Unknown resolution: {', '.join(bad)} (choose from {', '.join(RES_MODES)})", file=sys.stderr); return 2
+    workdir = args.workdir or tempfile.mkdtemp(prefix="dme_bench_")
+    os.makedirs(workdir, exist_ok=True)
+
+    name, path = make_clip(ffmpeg_path, workdir, args.clip_size, args.clip_seconds, args.clip_fps)
+    clip = {'name': name, 'path': path, 'frames': int(round(args.clip_seconds * args.clip_fps))}
+    cases = build_cases(args, ffmpeg_path)
+    if not cases:
+        print("No runnable cases (check --codec / --engine).", file=sys.stderr); return 2
+
+    print(f"Clip: {path} / Cases: {len(cases)}", flush=True)
+    results = []
+    for i, case in enumerate(cases):
+        row = run_case(ffmpeg_path, clip, case, workdir, args.repeat)
+        results.append(row)
+        label = " ".join(f"{k}={case[k]}" for k in ("codec", "preset", "crf", "filter", "res", "engine"))
+        if row['ok']:
+            extra = f" / cpu {row['cpu_s']:.2f}s / rss {row['rss_mb']:.0f}MB" if row['cpu_s'] is not None else ""
+            print(f"[{i + 1}/{len(cases)}] {label}: {row['fps']:.1f} fps / {row['wall_s']:.2f}s{extra} / "
+                  f"{row['size_bytes'] / 1024:.0f}KB", flush=True)
+        else:
+            print(f"[{i + 1}/{len(cases)}] {label}: FAILED", flush=True)
+
+    meta = {'date': time.strftime("%Y-%m-%d %H:%M:%S"), 'ffmpeg': ffmpeg_version(ffmpeg_path),
+            'platform': platform.platform(), 'python': platform.python_version(), 'cpu_count': os.cpu_count()}
+    if args.json:
+        with open(args.json, 'w') as f: json.dump({'meta': meta, 'results': results}, f, indent=4)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS); writer.writeheader(); writer.writerows(results)
+
+    code = 0 if all(r['ok'] for r in results) else 1
+    if args.baseline:
+        with open(args.baseline, 'r') as f: baseline = json.load(f)
+        flags = find_regressions(results, baseline, args.threshold)
+        for r, metric, old, new in flags:
+            label = " ".join(str(r[k]) for k in ("codec", "preset", "crf", "filter", "res", "engine"))
+            print(f"REGRESSION {label}: {metric} {old} -> {new}", file=sys.stderr)
+        if flags: code = 1
+        else: print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%}).")
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
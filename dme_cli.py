@@ -0,0 +1,211 @@
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dme_core import (create_job, RES_MODES, PLAN_MODES, ENGINES, find_ffmpeg, auto_sigmar, default_concurrency,
+                      collect_inputs, params_from_settings, check_plan, format_eta, shared_cache, CACHE_INDEX_PATH,
+                      parse_variants, is_stream_path, ffmpeg_capabilities, cached_capabilities)
+
+# ==========================================
+# DME 명령줄 실행기 (PyQt6 / 디스플레이 불필요)
+# ==========================================
+# 예: python dme_cli.py input_dir -o out --filter --blur 0.8 --res 518 -j 4
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="dme", description="Depth Map Extract (DME) - headless runner")
+    p.add_argument("inputs", nargs="+", help="input video files or folders, or '-' / a FIFO to stream")
+    p.add_argument("-o", "--output", required=True, help="output folder, or '-' to stream to stdout")
+    p.add_argument("--settings", help="load defaults from a GUI settings file (settings_single.json)")
+    p.add_argument("--ffmpeg", help="path to ffmpeg binary (default: auto-detect)")
+    p.add_argument("--filter", dest="use_filter", action="store_true", default=None, help="apply gblur + bilateral filter")
+    p.add_argument("--no-filter", dest="use_filter", action="store_false")
+    p.add_argument("--blur", type=float, help="G-Blur sigma (0.00 - 3.00)")
+    p.add_argument("--sigmar", help="Sigma R (0.000 - 0.040) or 'auto'")
+    p.add_argument("--res", choices=RES_MODES, help="target resolution")
+    p.add_argument("--ext", choices=["mp4", "mkv", "ts", "npy", "raw", "png", "tiff"],
+                   help="video container, or 16-bit depth export: npy/raw frame stack, png/tiff sequence")
+    p.add_argument("--codec", help="libx265 / libx264 / hevc_nvenc / h264_nvenc, or 'auto' for the fastest encoder "
+                                   "measured on this machine at the target quality")
+    p.add_argument("--crf", type=int, help="quality (CRF/CQ)")
+    p.add_argument("--preset")
+    p.add_argument("--segments", type=int, help="split each video into N GOP-aligned segments encoded in parallel")
+    p.add_argument("--plan", choices=PLAN_MODES, help="filter graph planning: exact (legacy order) or fast (cost-based)")
+    p.add_argument("--check-plan", type=float, metavar="SECONDS",
+                   help="report PSNR/SSIM drift of fast vs exact plan over the first SECONDS, then exit")
+    p.add_argument("--engine", choices=ENGINES, help="filter engine: ffmpeg filters or NumPy over raw frames")
+    p.add_argument("--check-engine", type=float, metavar="SECONDS",
+                   help="compare the NumPy engine against the ffmpeg filters over the first SECONDS, then exit")
+    p.add_argument("--refresh-caps", action="store_true",
+                   help="re-probe this ffmpeg's encoders/filters and redo 'auto' calibration instead of using the cache")
+    p.add_argument("--sweep", metavar="SPEC",
+                   help="decode once and encode several variants, e.g. \"blur=0.8,res=518; blur=1.0,sigmar=auto,res=392\" "
+                        "(keys: blur, sigmar, res, codec, crf, preset)")
+    p.add_argument("--input-format", help="container of a streamed input when it cannot be probed (e.g. nut, matroska)")
+    p.add_argument("--stream-frames", type=int, help="expected frame count of a streamed input (for percent/ETA)")
+    p.add_argument("--no-cache", dest="cache", action="store_false", default=None,
+                   help="do not reuse or record outputs in the output cache")
+    p.add_argument("--force", action="store_true", help="re-encode even if an identical output is cached")
+    p.add_argument("--cache-index", help=f"output cache index file (default: {CACHE_INDEX_PATH})")
+    p.add_argument("--profile", action="store_true", default=None,
+                   help="sample CPU/RSS/fps and write a <output>.run.json record with per-stage timings")
+    p.add_argument("--profile-stages", type=float, metavar="SECONDS",
+                   help="also time each filter stage over the first SECONDS (implies --profile)")
+    p.add_argument("--metrics", metavar="FILE", help="accumulate Prometheus text-format metrics in FILE")
+    p.add_argument("--farm", metavar="URL", help="submit to a dme_farm.py coordinator instead of encoding locally")
+    p.add_argument("--farm-token", help="shared secret of the coordinator (X-DME-Token)")
+    p.add_argument("-j", "--jobs", type=int, default=0, help="parallel jobs (0 = auto)")
+    p.add_argument("-q", "--quiet", action="store_true", help="only print errors and results")
+    return p
+
+def build_params(args, input_path, ffmpeg_path):
+    settings = {}
+    if args.settings:
+        with open(args.settings, 'r') as f: settings = json.load(f)
+    params = params_from_settings(settings, input_path, args.output, ffmpeg_path)
+    params['force'] = args.force
+    for key, value in [('use_filter', args.use_filter), ('blur', args.blur), ('res_mode', args.res),
+                       ('ext', args.ext), ('codec', args.codec), ('crf', args.crf), ('preset', args.preset),
+                       ('segments', args.segments), ('plan_mode', args.plan),
+                       ('engine', args.engine), ('cache', args.cache), ('input_format', args.input_format),
+                       ('stream_frames', args.stream_frames), ('profile', args.profile or (args.profile_stages and True)),
+                       ('profile_stages', args.profile_stages), ('metrics_file', args.metrics)]:
+        if value is not None: params[key] = value
+    if args.sigmar == "auto" or (args.sigmar is None and args.blur is not None and settings.get("auto", True)):
+        params['sigmar'] = auto_sigmar(params['blur'])
+    elif args.sigmar is not None:
+        params['sigmar'] = float(args.sigmar)
+    if args.sweep: params['variants'] = parse_variants(args.sweep, params)
+    return params
+
+def run_farm(args, files, ffmpeg_path):
+    # 코디네이터에 제출하고 진행 상황만 따라감 (경로는 작업자가 볼 수 있도록 절대 경로로)
+    from dme_farm import FarmClient, TERMINAL, LOST_JOB
+    if args.output == "-" or any(is_stream_path(f) for f in files):
+        print("--farm needs input files and an output folder on shared storage.", file=sys.stderr); return 2
+    args.output = os.path.abspath(args.output)
+    client = FarmClient(args.farm, args.farm_token)
+    try:
+        ids = {client.submit(build_params(args, os.path.abspath(f), ffmpeg_path)): f for f in files}
+    except ValueError as e: print(f"--sweep: {e}", file=sys.stderr); return 2
+    except OSError as e: print(f"Coordinator unreachable: {e}", file=sys.stderr); return 2
+    if not args.quiet: print(f"Submitted {len(ids)} job(s) to {args.farm}", flush=True)
+    shown, states = {}, {}
+    try:
+        while len(states) < len(ids):
+            time.sleep(1.0)
+            try: jobs = client.jobs(list(ids))
+            except (OSError, ValueError): continue
+            known = {job["id"] for job in jobs}
+            for jid in ids:
+                if jid not in known and jid not in states:
+                    states[jid] = "failed"
+                    print(f"[{jid}] {os.path.basename(ids[jid])} ✖ {LOST_JOB}", file=sys.stderr, flush=True)
+            for job in jobs:
+                if job["id"] in states: continue
+                tag = f"[{job['id']}] {os.path.basename(ids[job['id']])}"
+                if job["state"] == "running" and not args.quiet and job["progress"] - shown.get(job["id"], -10) >= 10:
+                    shown[job["id"]] = job["progress"]
+                    print(f"{tag} {job['progress']}% on {job['worker']} ETA {format_eta(job['stats'].get('eta'))}", flush=True)
+                if job["state"] not in TERMINAL: continue
+                states[job["id"]] = job["state"]
+                if job["state"] == "done":
+                    for path in job["outputs"]: print(f"{tag} ✔ {path}", flush=True)
+                else: print(f"{tag} ✖ {job['error'] or job['state']}", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        print("🛑 Aborted.", file=sys.stderr)
+        for jid in ids:
+            try: client.cancel(jid)
+            except OSError: pass
+        return 130
+    return 0 if all(s == "done" for s in states.values()) else 1
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    ffmpeg_path = args.ffmpeg or find_ffmpeg()
+    if not ffmpeg_path:
+        print("FFmpeg not found.", file=sys.stderr); return 2
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("No input videos found.", file=sys.stderr); return 2
+    to_stdout = args.output == "-"
+    if to_stdout and len(files) != 1:
+        print("Streaming to stdout takes exactly one input.", file=sys.stderr); return 2
+    if not to_stdout: os.makedirs(args.output, exist_ok=True)
+
+    if args.check_plan:
+        for f in files:
+            params = build_params(args, f, ffmpeg_path)
+            try: r = check_plan(params, args.check_plan)
+            except RuntimeError as e: print(f"{f}: {e}", file=sys.stderr); return 1
+            print(f"{os.path.basename(f)}: PSNR {r['psnr']:.2f} dB / SSIM {r['ssim']:.5f} / "
+                  f"cost {r['cost_exact']:.2f} -> {r['cost_fast']:.2f}")
+            print(f"  exact: {r['exact']}\n  fast:  {r['fast']}")
+        return 0
+
+    if args.check_engine:
+        from dme_numpy import check_engine, ENGINE_TOLERANCE
+        ok = True
+        for f in files:
+            params = build_params(args, f, ffmpeg_path)
+            try: r = check_engine(params, args.check_engine)
+            except RuntimeError as e: print(f"{f}: {e}", file=sys.stderr); return 1
+            ok = ok and r["ok"]
+            print(f"{os.path.basename(f)}: PSNR {r['psnr']:.2f} dB / SSIM {r['ssim']:.5f} "
+                  f"(tolerance {ENGINE_TOLERANCE['psnr']} dB / {ENGINE_TOLERANCE['ssim']}) {'OK' if r['ok'] else 'FAIL'}")
+        return 0 if ok else 1
+
+    if args.farm: return run_farm(args, files, ffmpeg_path)
+
+    # 기능 탐지는 캐시가 없을 때 백그라운드로만 (시작을 막지 않음). 캐시가 생기면 다음 실행부터 create_job이 코덱을 확인
+    if args.refresh_caps: ffmpeg_capabilities(ffmpeg_path, refresh=True)
+    elif not cached_capabilities(ffmpeg_path): threading.Thread(target=ffmpeg_capabilities, args=(ffmpeg_path,), daemon=True).start()
+    cache = shared_cache(args.cache_index) if args.cache_index else shared_cache()
+    try: jobs = [create_job(build_params(args, f, ffmpeg_path), cache) for f in files]
+    except ValueError as e: print(e, file=sys.stderr); return 2
+    workers = args.jobs or default_concurrency(jobs[0].params['codec'])
+    print_lock = threading.Lock()
+    results = {}
+
+    def say(msg, err=False):
+        # stdout으로 영상을 내보낼 때는 모든 메시지를 stderr로
+        with print_lock: print(msg, file=sys.stderr if err or to_stdout else sys.stdout, flush=True)
+
+    def run_one(idx, job):
+        tag = f"[{idx + 1}/{len(jobs)}]"
+        last, stats, shown = -10, {}, 0.0
+        for kind, value in job.run():
+            if kind == "stats":
+                stats = value
+                # 길이를 모르는 스트림은 백분율 대신 처리한 프레임 수를 주기적으로 표시
+                if value['percent'] is None and value['frame'] and not args.quiet and value['elapsed'] - shown >= 5:
+                    shown = value['elapsed']
+                    say(f"{tag} {os.path.basename(job.params['input_path'])} frame {value['frame']}"
+                        + (f" {value['fps']:.1f} fps" if value.get('fps') else ""))
+            elif kind == "progress" and not args.quiet and value - last >= 10 and value < 100:
+                last = value
+                rate = f" {stats['fps']:.1f} fps" if stats.get("fps") else ""
+                say(f"{tag} {os.path.basename(job.params['input_path'])} {value}%{rate} ETA {format_eta(stats.get('eta'))}")
+            elif kind == "log" and not args.quiet: say(f"{tag} {value}")
+            elif kind == "error": say(f"{tag} ✖ {value}", err=True)
+            elif kind == "done":
+                for path in value if isinstance(value, list) else [value]: say(f"{tag} ✔ {path}")
+            if kind in ("done", "error", "cancelled"): results[idx] = kind
+
+    if not args.quiet: say(f"Jobs: {len(jobs)} / Parallel: {workers}")
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = [pool.submit(run_one, i, j) for i, j in enumerate(jobs)]
+    try:
+        for fut in futures: fut.result()
+    except KeyboardInterrupt:
+        say("🛑 Aborted.", err=True)
+        for j in jobs: j.stop()
+        pool.shutdown(wait=True, cancel_futures=True)
+        return 130
+    pool.shutdown()
+    return 0 if all(results.get(i) == "done" for i in range(len(jobs))) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1241 @@
+import os
+import json
+import time
+import hashlib
+import itertools
+import shutil
+import subprocess
+import re
+import stat
+import platform
+import threading
+import tempfile
+import queue
+from collections import deque
+from contextlib import contextmanager
+
+# ==========================================
+# DME 처리 파이프라인 (PyQt6 없이 사용 가능한 API)
+# ==========================================
+# 사용 예:
+#   job = EncodeJob(params)
+#   for kind, value in job.run():   # ("log", str) / ("progress", int) / ("done", 출력 경로)
+#       ...                         # ("stats", dict) / ("error", str) / ("cancelled", None)
+
+VIDEO_EXTS = (".mp4", ".mkv", ".ts")
+EXPORT_EXTS = ("npy", "raw", "png", "tiff")  # 16비트 깊이 내보내기 (dme_export)
+RES_MODES = ("none", "518", "512", "504", "392")
+CREATION_FLAGS = 0x08000000 if platform.system() == "Windows" else 0  # CREATE_NO_WINDOW
+
+DEFAULT_PARAMS = {
+    'use_filter': False, 'res_mode': "none", 'aspect_ratio': "NONE",
+    'blur': 0.50, 'sigmar': 0.020, 'ext': "mp4", 'codec': "libx265", 'crf': 18, 'preset': "medium",
+    'segments': 0, 'plan_mode': "exact", 'engine': "ffmpeg", 'cache': True, 'force': False
+}
+ENGINES = ("ffmpeg", "numpy")
+
+def find_ffmpeg():
+    local_path = os.path.join(os.getcwd(), "ffmpeg.exe")
+    if os.path.exists(local_path): return local_path
+    sys_path = shutil.which("ffmpeg")
+    return sys_path if sys_path else None
+
+def find_ffprobe(ffmpeg_path):
+    ffprobe_name = "ffprobe.exe" if platform.system() == "Windows" else "ffprobe"
+    ffprobe_path = os.path.join(os.path.dirname(ffmpeg_path), ffprobe_name)
+    return ffprobe_path if os.path.exists(ffprobe_path) else None
+
+# 입력 정보 캐시: (절대 경로, 크기, 수정 시각) -> {"duration", "width", "height", "fps", "frames"}
+_probe_cache = {}
+_probe_lock = threading.Lock()
+
+def _file_key(file_path):
+    try: st = os.stat(file_path)
+    except OSError: return None
+    return (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+
+def cached_media(file_path):
+    key = _file_key(file_path)
+    with _probe_lock: return _probe_cache.get(key) if key else None
+
+def parse_media_header(text):
+    # ffmpeg 로그 머리말("Duration: ...", "Video: ..., 1920x1080, ..., 24 fps")에서 입력 정보 추출
+    info = {}
+    m = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", text)
+    if m: info["duration"] = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+    m = re.search(r"Stream #\d+:\d+.*?: Video: .*?, (\d{2,5})x(\d{2,5})", text)
+    if m: info["width"], info["height"] = int(m.group(1)), int(m.group(2))
+    m = re.search(r"Stream #\d+:\d+.*?: Video: .*?, ([\d.]+) (?:fps|tbr)", text)
+    if m: info["fps"] = m.group(1)
+    return info
+
+def probe_media(ffmpeg_path, file_path):
+    # 파일당 한 번만 조회하고 캐시 (ffprobe가 없으면 ffmpeg -i 출력으로 대체)
+    key = _file_key(file_path)
+    if key is None: return None
+    with _probe_lock:
+        if key in _probe_cache: return _probe_cache[key]
+    info = None
+    ffprobe_path = find_ffprobe(ffmpeg_path)
+    if ffprobe_path:
+        try:
+            cmd = [ffprobe_path, "-v", "error", "-select_streams", "v:0",
+                   "-show_entries", "format=duration:stream=width,height,r_frame_rate,nb_frames", "-of", "json", file_path]
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    text=True, encoding='utf-8', creationflags=CREATION_FLAGS, timeout=10)
+            data = json.loads(result.stdout)
+            st, fmt = data["streams"][0], data.get("format", {})
+            info = {"duration": float(fmt.get("duration") or 0), "width": int(st["width"]), "height": int(st["height"]),
+                    "fps": st.get("r_frame_rate", "0"), "frames": int(st["nb_frames"]) if str(st.get("nb_frames", "")).isdigit() else 0}
+        except: info = None
+    if info is None:
+        try:
+            result = subprocess.run([ffmpeg_path, "-hide_banner", "-i", file_path], stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='ignore',
+                                    creationflags=CREATION_FLAGS, timeout=10)
+            info = parse_media_header(result.stdout)
+        except: info = {}
+        if "width" not in info: return None
+        info.setdefault("duration", 0.0); info.setdefault("fps", "0"); info["frames"] = 0
+    if not info["frames"] and info["duration"]: info["frames"] = int(info["duration"] * fps_value(info["fps"]))
+    with _probe_lock: _probe_cache[key] = info
+    return info
+
+def get_duration(ffmpeg_path, file_path):
+    info = probe_media(ffmpeg_path, file_path)
+    return info["duration"] if info else 0
+
+def probe_video_size(ffmpeg_path, file_path):
+    info = probe_media(ffmpeg_path, file_path)
+    return (info["width"], info["height"]) if info else None
+
+def fps_value(rate):
+    num, _, den = str(rate).partition("/")
+    try: return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError): return 0.0
+
+def probe_keyframes(ffmpeg_path, file_path):
+    # 패킷 플래그만 읽으므로 디코딩 없이 빠르게 키프레임 위치를 얻음
+    ffprobe_path = find_ffprobe(ffmpeg_path)
+    if not ffprobe_path: return []
+    cmd = [ffprobe_path, "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+           "-of", "csv=p=0", file_path]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                text=True, encoding='utf-8', creationflags=CREATION_FLAGS, timeout=120)
+    except: return []
+    keys = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try: keys.append(float(pts))
+            except ValueError: pass
+    return sorted(keys)
+
+def plan_segments(duration, keyframes, count, min_length=10.0):
+    # 길이를 count 등분한 지점을 가장 가까운 키프레임(GOP 경계)에 맞춤
+    count = max(1, min(count, int(duration // min_length)))
+    cuts = []
+    for i in range(1, count):
+        target = duration * i / count
+        if keyframes: target = min(keyframes, key=lambda k: abs(k - target))
+        prev = cuts[-1] if cuts else 0.0
+        if target - prev >= min_length / 2 and duration - target >= min_length / 2: cuts.append(target)
+    bounds = [0.0] + cuts + [duration]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+# 동시 작업끼리 같은 출력 파일명을 고르지 않도록 예약 목록을 공유
+_reserved_paths = set()
+_path_lock = threading.Lock()
+
+def get_unique_path(folder, base_name, ext):
+    # ext가 None이면 확장자 없는 이름(폴더용)
+    suffix = f".{ext}" if ext else ""
+    with _path_lock:
+        path = os.path.join(folder, f"{base_name}{suffix}")
+        counter = 1
+        while os.path.exists(path) or path in _reserved_paths:
+            path = os.path.join(folder, f"{base_name} ({counter}){suffix}")
+            counter += 1
+        _reserved_paths.add(path)
+        return path
+
+def auto_sigmar(bv):
+    # G 블러 값에 맞춘 Sigma R 자동 밸런스
+    if bv <= 0.6: sv = 0.020
+    elif bv <= 0.8: sv = 0.020 + (bv - 0.6) * 0.03
+    elif bv <= 1.0: sv = 0.026 + (bv - 0.8) * 0.035
+    elif bv <= 1.2: sv = 0.033 + (bv - 1.0) * 0.035
+    else: sv = 0.040
+    return round(sv, 3)
+
+def default_concurrency(codec):
+    cores = os.cpu_count() or 1
+    if "nvenc" in codec: return 3  # GeForce 계열 NVENC 동시 세션 한도
+    if codec == "libx265": return max(1, cores // 6)  # x265는 자체 스레드 풀이 커서 작업 수를 줄임
+    return max(1, cores // 4)
+
+def is_stream_path(path):
+    # "-"(표준 입출력), "pipe:N", FIFO, 윈도우 이름 있는 파이프 -> 길이를 모르는 스트림
+    if path == "-" or path.startswith("pipe:") or path.startswith("\\\\.\\pipe\\"): return True
+    try: return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError: return False
+
+def collect_inputs(paths):
+    files = []
+    for p in paths:
+        if is_stream_path(p): files.append(p)
+        elif os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                full = os.path.join(p, name)
+                if os.path.isfile(full) and name.lower().endswith(VIDEO_EXTS): files.append(full)
+        elif os.path.isfile(p):
+            files.append(p)
+    return files
+
+def params_from_settings(d, input_path, output_folder, ffmpeg_path):
+    # settings_single.json(GUI 저장 형식) -> 작업 params
+    params = dict(DEFAULT_PARAMS)
+    params.update({
+        'input_path': input_path, 'output_folder': output_folder, 'ffmpeg_path': ffmpeg_path,
+        'use_filter': d.get("use_filter", params['use_filter']), 'res_mode': d.get("res_mode", params['res_mode']),
+        'blur': d.get("blur", params['blur']), 'ext': d.get("ext", params['ext']),
+        'codec': d.get("codec", params['codec']), 'crf': int(d.get("crf", params['crf'])),
+        'preset': d.get("preset", params['preset']), 'segments': d.get("segments", params['segments']),
+        'plan_mode': d.get("plan_mode", params['plan_mode']), 'engine': d.get("engine", params['engine']),
+        'cache': d.get("cache", params['cache']), 'profile': d.get("profile", False),
+        'metrics_file': d.get("metrics_file")
+    })
+    params['sigmar'] = auto_sigmar(params['blur']) if d.get("auto", True) else d.get("sigmar", params['sigmar'])
+    return params
+
+def output_suffix(params):
+    return f"_G{params['blur']:.2f}_S{params['sigmar']:.3f}"
+
+def build_filter_chain(params):
+    vf_chain = ["crop=iw/2:ih:iw/2:0"]
+    if params['use_filter']:
+        vf_chain.append(f"gblur=sigma={params['blur']}")
+        vf_chain.append(f"bilateral=sigmaS={params['blur']}:sigmaR={params['sigmar']}")
+    if params['res_mode'] != "none":
+        vf_chain.append(f"scale={params['res_mode']}:{params['res_mode']}")
+    if params.get('aspect_ratio', "NONE") != "NONE":
+        vf_chain.append(f"setdar={params['aspect_ratio']}")
+    return vf_chain
+
+# ==========================================
+# 필터 그래프 플래너 (exact: 기존 순서 그대로 / fast: 비용 모델로 순서 재배치)
+# ==========================================
+PLAN_MODES = ("exact", "fast")
+# 메가픽셀(평면 1장)당 상대 비용. bilateral이 압도적으로 비쌈
+FILTER_COST = {"crop": 0.05, "format": 0.3, "gblur": 2.0, "bilateral": 10.0, "scale": 1.5, "setdar": 0.0}
+YUV420_PLANES = 1.5  # yuv420p는 화소당 1.5 샘플, gray는 1 샘플
+TV_TO_FULL = 255.0 / 219.0  # format=gray는 TV 범위 Y를 전체 범위로 펼침
+
+def _fmt(v): return f"{v:.6g}"
+
+def filter_stages(params, src_size=None, scale_first=False, gray=False):
+    # (이름, 인자 문자열, 처리 전 가로, 처리 전 세로, 평면 계수) 목록
+    w, h = (src_size[0] // 2, src_size[1]) if src_size else (960, 1080)
+    planes = YUV420_PLANES
+    stages = [("crop", "iw/2:ih:iw/2:0", w * 2, h, planes)]
+    res = params['res_mode']
+    fx, fy = (int(res) / w, int(res) / h) if res != "none" else (1.0, 1.0)
+    if gray:
+        stages.append(("format", "gray", w, h, planes)); planes = 1.0
+
+    def add_scale():
+        nonlocal w, h
+        stages.append(("scale", f"{res}:{res}", w, h, planes)); w, h = int(res), int(res)
+
+    if res != "none" and scale_first: add_scale()
+    if params['use_filter']:
+        blur, sigmar = params['blur'], params['sigmar']
+        sx, sy = (blur * fx, blur * fy) if scale_first else (blur, blur)
+        if gray: sigmar = min(sigmar * TV_TO_FULL, 1.0)
+        gblur = f"sigma={_fmt(sx)}" + (f":sigmaV={_fmt(sy)}" if sx != sy else "")
+        stages.append(("gblur", gblur, w, h, planes))
+        stages.append(("bilateral", f"sigmaS={_fmt((sx * sy) ** 0.5)}:sigmaR={_fmt(sigmar)}", w, h, planes))
+    if res != "none" and not scale_first: add_scale()
+    if gray:
+        stages.append(("format", "yuv420p", w, h, planes)); planes = YUV420_PLANES
+    if params.get('aspect_ratio', "NONE") != "NONE":
+        stages.append(("setdar", params['aspect_ratio'], w, h, planes))
+    return stages
+
+def plan_cost(stages):
+    return sum(FILTER_COST[name] * w * h / 1e6 * planes for name, _, w, h, planes in stages)
+
+def plan_filter_chain(params, src_size=None, mode=None):
+    mode = mode or params.get('plan_mode', "exact")
+    if mode != "fast": return build_filter_chain(params)
+    # 원본 크기를 모르면 sigma를 환산할 수 없으므로 순서는 유지하고 단일 평면 처리만 적용
+    candidates = [filter_stages(params, src_size, scale_first=False, gray=True)]
+    if src_size and params['res_mode'] != "none" and params['use_filter']:
+        candidates.append(filter_stages(params, src_size, scale_first=True, gray=True))
+    best = min(candidates, key=plan_cost)
+    return [f"{name}={args}" for name, args, *_ in best]
+
+def _similarity(cmd):
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                            encoding='utf-8', errors='ignore', creationflags=CREATION_FLAGS)
+    psnr = re.search(r"PSNR .*average:(inf|[\d.]+)", result.stdout)
+    ssim = re.search(r"SSIM .*All:([\d.]+)", result.stdout)
+    if result.returncode != 0 or not psnr or not ssim:
+        raise RuntimeError("Drift check failed:\n" + "\n".join(result.stdout.strip().splitlines()[-5:]))
+    return {"psnr": float(psnr.group(1)), "ssim": float(ssim.group(1))}
+
+def measure_drift(ffmpeg_path, input_path, chain_a, chain_b, seconds=5.0):
+    # 두 필터 체인의 결과(인코딩 전)를 Y 평면 기준 PSNR/SSIM으로 비교
+    graph = (f"[0:v]split=2[a][b];[a]{','.join(chain_a)},format=gray,split[a1][a2];"
+             f"[b]{','.join(chain_b)},format=gray,split[b1][b2];[a1][b1]psnr[p];[a2][b2]ssim[q]")
+    return _similarity([ffmpeg_path, "-hide_banner", "-nostats", "-t", _fmt(seconds), "-i", input_path,
+                        "-filter_complex", graph, "-map", "[p]", "-f", "null", "-", "-map", "[q]", "-f", "null", "-"])
+
+def compare_files(ffmpeg_path, path_a, path_b, chain_b=None, seconds=5.0):
+    # path_a 그대로 vs path_b에 chain_b를 적용한 결과 비교 (엔진 검증용)
+    chain = ",".join(chain_b) + "," if chain_b else ""
+    graph = (f"[0:v]format=gray,split[a1][a2];[1:v]{chain}format=gray,split[b1][b2];"
+             f"[a1][b1]psnr[p];[a2][b2]ssim[q]")
+    return _similarity([ffmpeg_path, "-hide_banner", "-nostats", "-t", _fmt(seconds), "-i", path_a,
+                        "-t", _fmt(seconds), "-i", path_b, "-filter_complex", graph,
+                        "-map", "[p]", "-f", "null", "-", "-map", "[q]", "-f", "null", "-"])
+
+def check_plan(params, seconds=5.0):
+    src_size = probe_video_size(params['ffmpeg_path'], params['input_path'])
+    exact = plan_filter_chain(params, src_size, "exact")
+    fast = plan_filter_chain(params, src_size, "fast")
+    drift = measure_drift(params['ffmpeg_path'], params['input_path'], exact, fast, seconds)
+    drift.update({"exact": ",".join(exact), "fast": ",".join(fast),
+                  "cost_exact": plan_cost(filter_stages(params, src_size)),
+                  "cost_fast": min(plan_cost(filter_stages(params, src_size, sf, True)) for sf in (False, True))})
+    return drift
+
+def profile_filter_stages(params, seconds=5.0):
+    # 필터 체인을 앞에서부터 한 단계씩 늘려 -benchmark CPU 시간 차이로 단계별 비용 추정
+    # (ffmpeg는 필터별 시간을 따로 알려주지 않음. 첫 항목은 디코딩 + crop)
+    src_size = probe_video_size(params['ffmpeg_path'], params['input_path'])
+    chain, stages, prev = plan_filter_chain(params, src_size), [], 0.0
+    for i in range(1, len(chain) + 1):
+        cmd = [params['ffmpeg_path'], "-hide_banner", "-nostats", "-benchmark", "-t", _fmt(seconds),
+               "-i", params['input_path'], "-vf", ",".join(chain[:i]), "-f", "null", "-"]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8',
+                             errors='ignore', creationflags=CREATION_FLAGS).stdout
+        m = BENCH_TOTAL.search(out)
+        if not m: break
+        cpu = float(m.group(1)) + float(m.group(2))
+        stages.append({"stage": chain[i - 1].split("=")[0] if i > 1 else "decode+crop", "filter": chain[i - 1],
+                       "cpu_s": round(max(cpu - prev, 0.0), 4)})
+        prev = cpu
+    return stages
+
+def encoder_args(params):
+    args = ["-c:v", params['codec'], "-preset", params['preset']]
+    if "nvenc" in params['codec']:
+        args.extend(["-cq", str(params['crf'])])
+    else:
+        args.extend(["-crf", str(params['crf'])])
+    return args
+
+def encoder_available(ffmpeg_path, codec):
+    # 빌드에 포함돼도 장치가 없으면(NVENC 등) 실패하므로 짧은 인코딩으로 확인
+    cmd = [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "color=s=256x256:d=0.1",
+           "-c:v", codec, "-f", "null", "-"]
+    try: return subprocess.run(cmd, capture_output=True, timeout=30, creationflags=CREATION_FLAGS).returncode == 0
+    except (OSError, subprocess.TimeoutExpired): return False
+
+def build_command(params, output_path, vf_chain=None):
+    vf_chain = vf_chain or build_filter_chain(params)
+    cmd = [params['ffmpeg_path'], "-y", "-i", params['input_path'], "-vf", ",".join(vf_chain)]
+    cmd.extend(encoder_args(params))
+    cmd.extend(["-c:a", "copy", output_path])
+    return cmd
+
+# ==========================================
+# 진행 정보 (-progress 파이프의 key=value 블록, GUI로는 일정 간격으로만 전달)
+# ==========================================
+PROGRESS_INTERVAL = 0.25  # 진행률/통계 이벤트 최소 간격(초)
+PROGRESS_LINE = re.compile(r"^[a-z_0-9]+=")
+BENCH_CALL = re.compile(r"^bench:\s+\d+ user\s+\d+ sys\s+(\d+) real (\w+)")  # -benchmark_all (호출별 마이크로초)
+BENCH_TOTAL = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s")
+BENCH_RSS = re.compile(r"bench: maxrss=(\d+)")
+
+def progress_command(cmd, profile=False):
+    # 기계 판독용 진행 정보는 stdout으로, 로그는 stderr로 분리
+    # profile이면 디코딩/인코딩 호출 시간과 전체 CPU/최대 메모리(-benchmark)도 stderr로 받음
+    return [cmd[0], "-progress", "pipe:1", "-nostats"] + (["-benchmark_all", "-benchmark"] if profile else []) + cmd[1:]
+
+def parse_bench(line, bench):
+    # bench 줄이면 bench 딕셔너리에 누적하고 True
+    m = BENCH_CALL.match(line)
+    if m:
+        us = int(m.group(1))
+        if us < 60e6:  # 스레드 간 시계 차이로 음수가 부호 없는 값으로 찍히는 경우 제외
+            key = f"{m.group(2)}_s"; bench[key] = bench.get(key, 0.0) + us / 1e6
+        return True
+    m = BENCH_TOTAL.search(line)
+    if m:
+        bench.update(utime=float(m.group(1)), stime=float(m.group(2)), rtime=float(m.group(3))); return True
+    m = BENCH_RSS.search(line)
+    if m:
+        bench['maxrss_kb'] = int(m.group(1)); return True
+    return False
+
+def iter_progress(stream):
+    block = {}
+    for line in stream:
+        key, sep, value = line.strip().partition("=")
+        if not sep: continue
+        block[key] = value.strip()
+        if key == "progress":
+            yield block; block = {}
+
+def _num(value, cast=float):
+    try: return cast(str(value).rstrip("x"))
+    except (TypeError, ValueError): return None
+
+def block_seconds(block):
+    for k in ("out_time_us", "out_time_ms"):  # out_time_ms도 실제 단위는 마이크로초
+        v = _num(block.get(k), int)
+        if v is not None: return max(0, v) / 1e6
+    return None
+
+def format_eta(seconds):
+    if seconds is None: return "--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}" if seconds >= 3600 else f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+class StderrReader(threading.Thread):
+    # stderr는 따로 읽어 파이프가 막히지 않게 하고, 입력 머리말(길이/fps)과 마지막 로그만 보관
+    # progress=True면 stderr에 섞인 -progress 블록을 blocks 큐로 넘김 (끝나면 None)
+    def __init__(self, stream, keep=20, progress=False):
+        super().__init__(daemon=True)
+        self.stream, self.tail, self.info = stream, deque(maxlen=keep), {}
+        self.in_header = True
+        self.blocks, self.block = (queue.Queue() if progress else None), {}
+        self.bench = {}
+
+    def run(self):
+        try:
+            for line in self.stream:
+                line = line.rstrip()
+                if not line: continue
+                if self.blocks is not None and PROGRESS_LINE.match(line):
+                    key, _, value = line.partition("=")
+                    self.block[key] = value.strip()
+                    if key == "progress": self.blocks.put(self.block); self.block = {}
+                    continue
+                if line.startswith("bench:") and parse_bench(line, self.bench): continue  # 오류 로그가 밀려나지 않게
+                self.tail.append(line)
+                if self.in_header:
+                    if line.startswith("Output #"): self.in_header = False; continue
+                    for k, v in parse_media_header(line).items(): self.info.setdefault(k, v)
+        finally:
+            if self.blocks is not None: self.blocks.put(None)
+
+class ProgressTracker:
+    def __init__(self, duration=0, total_frames=0, interval=PROGRESS_INTERVAL):
+        self.duration, self.total_frames, self.interval = duration, total_frames, interval
+        self.start, self.last_emit = time.time(), 0.0
+
+    def update(self, seconds=None, frame=None, fps=None, speed=None, force=False):
+        now = time.time()
+        if not force and now - self.last_emit < self.interval: return []
+        self.last_emit = now
+        elapsed = max(now - self.start, 1e-6)
+        if fps is None and frame: fps = frame / elapsed
+        if speed is None and seconds: speed = seconds / elapsed
+        if self.duration > 0 and seconds is not None: ratio = seconds / self.duration
+        elif self.total_frames > 0 and frame is not None: ratio = frame / self.total_frames
+        else: ratio = None
+        eta = None
+        if ratio:
+            ratio = min(ratio, 1.0)
+            if speed and self.duration > 0 and seconds is not None: eta = max(self.duration - seconds, 0) / speed
+            else: eta = elapsed * (1 - ratio) / ratio
+        stats = {"percent": None if ratio is None else ratio * 100, "time": seconds, "frame": frame,
+                 "fps": fps, "speed": speed, "eta": eta, "elapsed": elapsed}
+        events = [("stats", stats)]
+        if ratio is not None: events.insert(0, ("progress", min(int(ratio * 100), 99)))
+        return events
+
+def remove_partial(path):
+    if path and os.path.exists(path):
+        try: os.remove(path)
+        except OSError: pass
+
+# ==========================================
+# 인코딩 작업
+# ==========================================
+class EncodeJob:
+    def __init__(self, params):
+        self.params = params
+        self.is_running = True
+        self.process = None
+        self.output_path = None
+        self.stages = {}  # 단계 이름 -> 경과 시간(초), ProfiledJob이 실행 기록에 사용
+        self.bench = {}   # ffmpeg -benchmark 결과 합계
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try: yield
+        finally: self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - start
+
+    def add_bench(self, bench):
+        for k, v in bench.items():
+            self.bench[k] = max(self.bench.get(k, 0), v) if k == "maxrss_kb" else self.bench.get(k, 0.0) + v
+
+    def prepare(self):
+        filename = os.path.basename(self.params['input_path'])
+        name_only, _ = os.path.splitext(filename)
+        self.output_path = get_unique_path(
+            self.params['output_folder'], f"{name_only}{output_suffix(self.params)}", self.params['ext'])
+        return filename
+
+    def filter_chain(self):
+        src_size = None
+        if self.params.get('plan_mode', "exact") == "fast":
+            src_size = probe_video_size(self.params['ffmpeg_path'], self.params['input_path'])
+        return plan_filter_chain(self.params, src_size)
+
+    def run(self):
+        filename = self.prepare()
+        # 캐시된 정보가 없으면 ffprobe를 따로 돌리지 않고 인코딩 로그 머리말에서 길이를 읽음
+        media = cached_media(self.params['input_path']) or {}
+        yield from self.run_single(filename, media.get("duration", 0), media.get("frames", 0))
+
+    def run_single(self, filename, duration, total_frames=0):
+        with self.timed("plan"): cmd = build_command(self.params, self.output_path, self.filter_chain())
+        if (yield from self.run_command(cmd, filename, duration, total_frames, [self.output_path])):
+            yield ("progress", 100)
+            yield ("done", self.output_path)
+
+    def run_command(self, cmd, filename, duration, total_frames, output_paths, to_stdout=False):
+        # ffmpeg 1회 실행. 성공하면 True, 실패/취소는 이벤트를 내고 False
+        # to_stdout이면 stdout은 출력 영상이 차지하므로 진행 정보를 stderr에 섞어 받음
+        profile = self.params.get('profile', False)
+        if to_stdout: cmd = [cmd[0], "-progress", "pipe:2", "-nostats"] + (["-benchmark"] if profile else []) + cmd[1:]
+        else: cmd = progress_command(cmd, profile)
+        yield ("log", f"▶ Start Processing: {filename}")
+        started = time.perf_counter()
+        process = self.process = subprocess.Popen(
+            cmd, stdout=None if to_stdout else subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, encoding='utf-8', errors='ignore', creationflags=CREATION_FLAGS
+        )
+        if not self.is_running: process.kill()
+        err = StderrReader(process.stderr, progress=to_stdout); err.start()
+
+        tracker = ProgressTracker(duration, total_frames)
+        for block in iter(err.blocks.get, None) if to_stdout else iter_progress(process.stdout):
+            if not self.is_running: break
+            if not tracker.duration: tracker.duration = err.info.get("duration", 0)
+            yield from tracker.update(block_seconds(block), _num(block.get("frame"), int), _num(block.get("fps")),
+                                      _num(block.get("speed")), force=block.get("progress") == "end")
+        process.wait(); err.join(timeout=2)
+        self.stages["ffmpeg"] = self.stages.get("ffmpeg", 0.0) + time.perf_counter() - started
+        self.add_bench(err.bench)
+        tail = list(err.tail)[-5:]
+
+        if not self.is_running:
+            # 취소된 작업의 불완전한 출력 파일 정리
+            for path in output_paths: remove_partial(path)
+            yield ("cancelled", None)
+            return False
+        if process.returncode != 0:
+            yield ("error", f"FFmpeg exited with code {process.returncode}: {filename}\n" + "\n".join(tail))
+            return False
+        return True
+
+    def stop(self):
+        self.is_running = False
+        if self.process:
+            self.process.kill()
+            self.process = None
+
+# ==========================================
+# 구간 병렬 인코딩 (긴 영상 1개를 GOP 단위로 나눠 동시 처리 후 무손실 결합)
+# ==========================================
+class SegmentedEncodeJob(EncodeJob):
+    def __init__(self, params):
+        super().__init__(params)
+        self.processes = []
+
+    def run(self):
+        ffmpeg_path, input_path = self.params['ffmpeg_path'], self.params['input_path']
+        with self.timed("probe"): media = probe_media(ffmpeg_path, input_path) or {}
+        duration = media.get("duration", 0)
+        filename = self.prepare()
+        with self.timed("keyframes"):
+            ranges = plan_segments(duration, probe_keyframes(ffmpeg_path, input_path), self.params['segments']) if duration > 0 else []
+        if len(ranges) < 2:
+            yield from self.run_single(filename, duration, media.get("frames", 0)); return
+
+        yield ("log", f"▶ Start Processing: {filename} ({len(ranges)} segments)")
+        work_dir = tempfile.mkdtemp(prefix=".dme_seg_", dir=self.params['output_folder'])
+        try:
+            yield from self.run_segments(filename, duration, ranges, work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def run_segments(self, filename, duration, ranges, work_dir):
+        ffmpeg_path, input_path = self.params['ffmpeg_path'], self.params['input_path']
+        with self.timed("plan"): vf = ",".join(self.filter_chain())
+        parts, events = [], queue.Queue()
+        profile, started = self.params.get('profile', False), time.perf_counter()
+
+        def pump(idx, proc):
+            err = StderrReader(proc.stderr); err.start()
+            for block in iter_progress(proc.stdout):
+                events.put(("time", idx, (block_seconds(block), _num(block.get("frame"), int))))
+            proc.wait(); err.join(timeout=2)
+            events.put(("exit", idx, (proc.returncode, list(err.tail)[-5:], err.bench)))
+
+        for idx, (start, end) in enumerate(ranges):
+            part = os.path.join(work_dir, f"part{idx:03d}.mkv"); parts.append(part)
+            cmd = [ffmpeg_path, "-y", "-ss", f"{start:.6f}"]
+            if idx < len(ranges) - 1: cmd.extend(["-t", f"{end - start:.6f}"])  # 마지막 구간은 끝까지
+            cmd.extend(["-i", input_path, "-vf", vf] + encoder_args(self.params) + ["-an", part])
+            proc = subprocess.Popen(progress_command(cmd, profile), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    universal_newlines=True, encoding='utf-8', errors='ignore', creationflags=CREATION_FLAGS)
+            self.processes.append(proc)
+            threading.Thread(target=pump, args=(idx, proc), daemon=True).start()
+        if not self.is_running: self.stop()
+
+        times, frames, remaining, failure = [0.0] * len(ranges), [0] * len(ranges), len(ranges), None
+        tracker = ProgressTracker(duration)
+        while remaining:
+            kind, idx, value = events.get()
+            if kind == "time":
+                seconds, frame = value
+                if seconds is not None: times[idx] = min(seconds, ranges[idx][1] - ranges[idx][0])
+                if frame is not None: frames[idx] = frame
+                if self.is_running:
+                    # 구간별 진행을 합산 (결합 단계를 위해 99%는 남겨 둠)
+                    for ev in tracker.update(sum(times), sum(frames)):
+                        yield ("progress", min(ev[1], 98)) if ev[0] == "progress" else ev
+            else:
+                remaining -= 1
+                rc, tail, bench = value
+                self.add_bench(bench)
+                if rc != 0 and self.is_running and failure is None:
+                    failure = f"FFmpeg exited with code {rc}: {filename} (segment {idx + 1})\n" + "\n".join(tail)
+                    self.kill_segments()
+        self.processes = []
+        self.stages["segments"] = time.perf_counter() - started
+
+        if not self.is_running:
+            yield ("cancelled", None); return
+        if failure:
+            yield ("error", failure); return
+
+        # 구간 결합 (재인코딩 없이 스트림 복사, 오디오는 원본에서 가져옴)
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for part in parts: f.write("file '" + part.replace("'", "'\\''") + "'\n")
+        cmd = [ffmpeg_path, "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-i", input_path,
+               "-map", "0:v", "-map", "1:a:0?", "-c", "copy", self.output_path]
+        process = self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                  universal_newlines=True, encoding='utf-8', errors='ignore', creationflags=CREATION_FLAGS)
+        if not self.is_running: process.kill()
+        with self.timed("concat"): out, _ = process.communicate()
+        if not self.is_running:
+            remove_partial(self.output_path); yield ("cancelled", None); return
+        if process.returncode != 0:
+            remove_partial(self.output_path)
+            yield ("error", f"FFmpeg concat failed: {filename}\n" + "\n".join(out.strip().splitlines()[-5:])); return
+        yield ("progress", 100)
+        yield ("done", self.output_path)
+
+    def kill_segments(self):
+        for proc in self.processes:
+            try: proc.kill()
+            except OSError: pass
+
+    def stop(self):
+        super().stop()
+        self.kill_segments()
+
+# ==========================================
+# 스트리밍 (표준 입력/FIFO -> 파일/표준 출력, 중간 디버그 영상 없이 바로 처리)
+# ==========================================
+STREAM_MUXERS = {"mp4": ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov"],  # 되감기 불가 출력용 조각 MP4
+                 "mkv": ["-f", "matroska"], "ts": ["-f", "mpegts"]}
+
+class StreamEncodeJob(EncodeJob):
+    # 전체 길이를 모르므로 진행은 프레임 수 기준 (stream_frames를 알면 백분율도 표시)
+    def run(self):
+        src, folder = self.params['input_path'], self.params['output_folder']
+        to_stdout = folder == "-"
+        name = "stream" if src == "-" or src.startswith("pipe:") else os.path.splitext(os.path.basename(src))[0]
+        if to_stdout: self.output_path = None
+        else: self.output_path = get_unique_path(folder, f"{name}{output_suffix(self.params)}", self.params['ext'])
+        cmd = [self.params['ffmpeg_path'], "-y"]
+        if self.params.get('input_format'): cmd.extend(["-f", self.params['input_format']])
+        cmd.extend(["-i", "pipe:0" if src == "-" else src, "-vf", ",".join(plan_filter_chain(self.params))])
+        cmd.extend(encoder_args(self.params) + ["-c:a", "copy"])
+        cmd.extend(STREAM_MUXERS[self.params['ext']] + ["pipe:1"] if to_stdout else [self.output_path])
+        outputs = [] if to_stdout else [self.output_path]
+        if (yield from self.run_command(cmd, name, 0, self.params.get('stream_frames', 0), outputs, to_stdout)):
+            yield ("progress", 100)
+            yield ("done", self.output_path or "<stdout>")
+
+# ==========================================
+# 출력 캐시 (입력 지문 + 정규화된 설정 + ffmpeg 버전 -> 이미 만든 출력 파일)
+# ==========================================
+CACHE_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".dme", "output_cache.json")
+CACHE_MAX_ENTRIES = 5000  # 색인 항목 수 한도 (바이트 한도가 아님: 출력은 지우지 않으므로 용량과 무관)
+CACHE_MAX_AGE_DAYS = 180
+HASH_CHUNK = 1 << 20  # 앞/가운데/끝에서 1MB씩만 읽어 해시
+_cache_lock = threading.Lock()  # 색인 파일 하나를 여러 인스턴스/스레드가 읽고 쓰므로 모듈 단위 잠금
+_shared_caches = {}  # 색인 경로 -> OutputCache (프로세스당 하나)
+
+_version_cache = {}  # (ffmpeg 경로, mtime) -> 버전 문자열
+
+def ffmpeg_version(ffmpeg_path):
+    try: key = (ffmpeg_path, os.path.getmtime(ffmpeg_path))
+    except OSError: key = (ffmpeg_path, 0)
+    if key not in _version_cache:
+        try:
+            out = subprocess.run([ffmpeg_path, "-version"], capture_output=True, text=True, timeout=10,
+                                 creationflags=CREATION_FLAGS).stdout
+            _version_cache[key] = out.splitlines()[0] if out else ""
+        except (OSError, subprocess.TimeoutExpired): _version_cache[key] = ""
+    return _version_cache[key]
+
+def partial_hash(file_path):
+    size = os.path.getsize(file_path)
+    h = hashlib.sha1(str(size).encode())
+    with open(file_path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - HASH_CHUNK // 2), max(0, size - HASH_CHUNK)}):
+            f.seek(offset); h.update(f.read(HASH_CHUNK))
+    return h.hexdigest()
+
+def cache_params(params):
+    # 출력 내용에 영향을 주는 설정만 (필터를 끄면 blur/sigmar는 무관)
+    keys = ['use_filter', 'res_mode', 'aspect_ratio', 'ext', 'codec', 'crf', 'preset', 'segments', 'plan_mode']
+    norm = {k: params.get(k, DEFAULT_PARAMS.get(k)) for k in keys}
+    norm['segments'] = norm['segments'] if (norm['segments'] or 0) > 1 else 0
+    if params['use_filter']:
+        norm.update(blur=round(params['blur'], 2), sigmar=round(params['sigmar'], 3), engine=params.get('engine', "ffmpeg"))
+    return norm
+
+def fingerprint(params):
+    st = os.stat(params['input_path'])
+    data = {'input': [st.st_size, st.st_mtime_ns, partial_hash(params['input_path'])],
+            'params': cache_params(params), 'ffmpeg': ffmpeg_version(params['ffmpeg_path'])}
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+class OutputCache:
+    # 색인은 JSON 파일 하나. 출력 파일 자체는 사용자 결과물이라 지우지 않고 색인 항목만 정리함
+    def __init__(self, path=CACHE_INDEX_PATH, max_entries=CACHE_MAX_ENTRIES, max_age_days=CACHE_MAX_AGE_DAYS):
+        self.path, self.max_entries, self.max_age = path, max_entries, max_age_days * 86400
+        self.lock = _cache_lock
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: return json.load(f)
+        except (OSError, ValueError): return {}
+
+    def save(self, index):
+        folder = os.path.dirname(self.path) or "."
+        os.makedirs(folder, exist_ok=True)
+        # 임시 파일 이름이 겹치지 않도록 (다른 프로세스가 같은 색인을 쓰는 경우 포함)
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=folder)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f: json.dump(index, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            remove_partial(tmp); raise
+
+    @staticmethod
+    def valid(entry):
+        # 출력이 지워졌거나 바뀌었으면 무효
+        try: st = os.stat(entry['path'])
+        except OSError: return False
+        return st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime_ns']
+
+    def evict(self, index):
+        now = time.time()
+        for key in [k for k, e in index.items() if now - e.get('last_used', 0) > self.max_age or not self.valid(e)]:
+            del index[key]
+        if len(index) > self.max_entries:
+            for key in sorted(index, key=lambda k: index[k].get('last_used', 0))[:len(index) - self.max_entries]:
+                del index[key]
+        return index
+
+    def lookup(self, key):
+        with self.lock:
+            index = self.load()
+            entry = index.get(key)
+            if entry is None: return None
+            if not self.valid(entry):
+                del index[key]; self.save(index); return None
+            entry['last_used'] = time.time(); self.save(index)
+            return entry['path']
+
+    def store(self, key, output_path, input_path):
+        with self.lock:
+            index = self.evict(self.load())
+            st = os.stat(output_path)
+            index[key] = {'path': os.path.abspath(output_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                          'input': os.path.abspath(input_path), 'created': time.time(), 'last_used': time.time()}
+            self.save(index)
+
+    def prune(self):
+        with self.lock:
+            index = self.load(); before = len(index)
+            self.save(self.evict(index))
+            return before - len(index)
+
+def shared_cache(path=CACHE_INDEX_PATH):
+    with _cache_lock:
+        if path not in _shared_caches: _shared_caches[path] = OutputCache(path)
+        return _shared_caches[path]
+
+def link_or_copy(src, folder, base_name, ext):
+    # 같은 폴더면 그대로 재사용, 다른 폴더면 하드링크(불가하면 복사)
+    if os.path.normcase(os.path.dirname(os.path.abspath(src))) == os.path.normcase(os.path.abspath(folder)): return src
+    dst = get_unique_path(folder, base_name, ext)
+    pairs = [(src, dst)]
+    # npy는 메타데이터 .json 사이드카도 함께 옮김
+    if ext == "npy" and os.path.exists(os.path.splitext(src)[0] + ".json"):
+        pairs.append((os.path.splitext(src)[0] + ".json", os.path.splitext(dst)[0] + ".json"))
+    for s, d in pairs:
+        try: os.link(s, d)
+        except OSError: shutil.copy2(s, d)
+    return dst
+
+class CachedJob:
+    # 다른 작업을 감싸서 캐시 적중 시 인코딩을 건너뜀 (force면 항상 다시 인코딩 후 색인 갱신)
+    def __init__(self, job, cache=None):
+        self.job, self.params = job, job.params
+        self.cache = cache or shared_cache()
+
+    @property
+    def is_running(self): return self.job.is_running
+
+    def run(self):
+        filename = os.path.basename(self.params['input_path'])
+        try:
+            with self.job.timed("fingerprint"): key = fingerprint(self.params)
+        except OSError as e:
+            yield ("error", f"Cannot read input: {e}"); return
+        try: hit = None if self.params.get('force') else self.cache.lookup(key)
+        except OSError: hit = None  # 색인을 읽거나 쓸 수 없으면 캐시 없이 인코딩
+        if hit:
+            name_only, _ = os.path.splitext(filename)
+            try: path = link_or_copy(hit, self.params['output_folder'], f"{name_only}{output_suffix(self.params)}", self.params['ext'])
+            except OSError: path = None
+            if path:
+                yield ("log", f"♻ Reusing cached output: {filename} -> {os.path.basename(path)}")
+                yield ("progress", 100)
+                yield ("done", path)
+                return
+        for kind, value in self.job.run():
+            if kind == "done":
+                try: self.cache.store(key, value, self.params['input_path'])
+                except OSError: pass
+            yield (kind, value)
+
+    def stop(self): self.job.stop()
+
+# ==========================================
+# 한 번 디코딩, 여러 변형 인코딩 (G-Blur/Sigma R/해상도/코덱 스윕)
+# ==========================================
+VARIANT_KEYS = {'blur': float, 'sigmar': float, 'res': str, 'codec': str, 'crf': int, 'preset': str}
+VARIANT_TAGS = {'res_mode': "_{}", 'codec': "_{}", 'crf': "_q{}", 'preset': "_{}"}
+
+def parse_variants(text, base):
+    # "blur=0.8,res=518; blur=1.0,sigmar=auto" -> 변형별 params 덮어쓰기 목록
+    # blur만 주거나 sigmar=auto면 해당 blur에 맞춘 자동 Sigma R
+    variants = []
+    for spec in filter(None, (p.strip() for p in text.split(";"))):
+        v = {}
+        for item in filter(None, (p.strip() for p in spec.split(","))):
+            key, sep, value = (x.strip() for x in item.partition("="))
+            if not sep or key not in VARIANT_KEYS: raise ValueError(f"Invalid variant item: {item}")
+            if key == "sigmar" and value == "auto": v['sigmar'] = "auto"; continue
+            try: v[key] = VARIANT_KEYS[key](value)
+            except ValueError: raise ValueError(f"Invalid value for {key}: {value}")
+        if 'res' in v:
+            if v['res'] not in RES_MODES: raise ValueError(f"Invalid resolution: {v['res']}")
+            v['res_mode'] = v.pop('res')
+        if v.get('sigmar') == "auto" or ('blur' in v and 'sigmar' not in v):
+            v['sigmar'] = auto_sigmar(v.get('blur', base['blur']))
+        # 코덱만 바꾸면 기본 프리셋이 새 코덱에 맞지 않을 수 있음 (한 ffmpeg 명령이라 스윕 전체가 실패)
+        codec = v.get('codec', base.get('codec'))
+        if 'preset' in v:
+            if codec in CODEC_PRESETS and v['preset'] not in CODEC_PRESETS[codec]:
+                raise ValueError(f"Invalid preset for {codec}: {v['preset']}")
+        elif codec in CODEC_PRESETS and base.get('preset') not in CODEC_PRESETS[codec]:
+            v['preset'] = CALIBRATION_PRESETS[codec]
+        variants.append(v)
+    return variants
+
+def sweep_graph(chains, src="[0:v]"):
+    # 변형별 필터 체인의 공통 접두 단계는 한 번만 실행하고 split으로 갈라짐. 출력 패드는 [v0], [v1], ...
+    parts, ids = [], itertools.count()
+
+    def walk(label, members, depth):
+        seq = []
+        while all(len(ch) > depth for _, ch in members) and len({ch[depth] for _, ch in members}) == 1:
+            seq.append(members[0][1][depth]); depth += 1
+        groups = {}
+        for i, ch in members: groups.setdefault(ch[depth] if len(ch) > depth else None, []).append((i, ch))
+        outs = [(f"[v{i}]", None) for i, _ in groups.pop(None, [])] + [(f"[s{next(ids)}]", g) for g in groups.values()]
+        if len(outs) == 1:
+            parts.append(f"{label}{','.join(seq) or 'null'}{outs[0][0]}"); return
+        parts.append(f"{label}{','.join(seq + [f'split={len(outs)}'])}{''.join(pad for pad, _ in outs)}")
+        for pad, group in outs:
+            if group: walk(pad, group, depth)
+
+    walk(src, list(enumerate(chains)), 0)
+    return ";".join(parts)
+
+class SweepEncodeJob(EncodeJob):
+    def __init__(self, params, cache=None):
+        super().__init__(params)
+        self.cache = cache
+
+    def run(self):
+        ffmpeg_path, input_path = self.params['ffmpeg_path'], self.params['input_path']
+        folder, filename = self.params['output_folder'], os.path.basename(input_path)
+        name_only, _ = os.path.splitext(filename)
+        variants = [dict(self.params, **v) for v in self.params['variants']]
+        # G/S 접미사가 같은 변형끼리 구분되도록 변형마다 달라지는 항목만 이름에 덧붙임
+        varying = [k for k in VARIANT_TAGS if len({str(v[k]) for v in variants}) > 1]
+        outputs, todo = [], []
+        for v in variants:
+            base = f"{name_only}{output_suffix(v)}" + "".join(VARIANT_TAGS[k].format(v[k]) for k in varying)
+            key = hit = None
+            if self.cache:
+                try: key = fingerprint(v)
+                except OSError as e: yield ("error", f"Cannot read input: {e}"); return
+                try: hit = None if v.get('force') else self.cache.lookup(key)
+                except OSError: hit = None
+            if hit:
+                try: path = link_or_copy(hit, folder, base, v['ext'])
+                except OSError: hit = None
+            if hit:
+                yield ("log", f"♻ Reusing cached output: {filename} -> {os.path.basename(path)}")
+            else:
+                path = get_unique_path(folder, base, v['ext']); todo.append((v, key, path))
+            outputs.append(path)
+
+        if todo:
+            with self.timed("probe"): media = probe_media(ffmpeg_path, input_path) or {}
+            src_size = (media['width'], media['height']) if media.get('width') else None
+            graph = sweep_graph([plan_filter_chain(v, src_size) for v, _, _ in todo])
+            cmd = [ffmpeg_path, "-y", "-i", input_path, "-filter_complex", graph]
+            for n, (v, _, path) in enumerate(todo):
+                cmd.extend(["-map", f"[v{n}]"] + encoder_args(v) + ["-map", "0:a?", "-c:a", "copy", path])
+            yield ("log", f"Sweep: {len(todo)} variants in one pass ({len(variants) - len(todo)} cached)")
+            ok = yield from self.run_command(cmd, filename, media.get("duration", 0), media.get("frames", 0),
+                                             [path for _, _, path in todo])
+            if not ok: return
+            for v, key, path in todo:
+                if key:
+                    try: self.cache.store(key, path, input_path)
+                    except OSError: pass
+        yield ("progress", 100)
+        yield ("done", outputs)
+
+# ==========================================
+# 프로파일링 (단계별 시간, ffmpeg 자식 프로세스 CPU/메모리 표본, 실행 기록 JSON, Prometheus 지표)
+# ==========================================
+SAMPLE_INTERVAL = 0.5
+METRICS_HELP = {
+    "dme_jobs_total": ("counter", "Finished DME jobs by status."),
+    "dme_frames_total": ("counter", "Frames processed by finished jobs."),
+    "dme_job_seconds_total": ("counter", "Wall time spent in jobs."),
+    "dme_cpu_seconds_total": ("counter", "CPU time of ffmpeg child processes."),
+    "dme_stage_seconds_total": ("counter", "Wall time per job stage."),
+    "dme_last_job_fps": ("gauge", "Average fps of the last finished job."),
+    "dme_last_job_peak_rss_bytes": ("gauge", "Peak RSS of the last job's ffmpeg processes."),
+}
+_metrics_lock = threading.Lock()
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def proc_usage(pid):
+    # (CPU 초, RSS 바이트). /proc가 없는 OS(Windows/macOS)는 None
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f: fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm", 'r') as f: rss_pages = int(f.read().split()[1])
+        return (int(fields[11]) + int(fields[12])) / _CLK_TCK, rss_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError, AttributeError): return None
+
+class ProcessSampler(threading.Thread):
+    # 작업의 ffmpeg 자식 프로세스들을 주기적으로 읽어 CPU%, RSS, fps 시계열을 남김
+    def __init__(self, pids_fn, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.pids_fn, self.interval = pids_fn, interval
+        self.samples, self.fps, self.cpu_total = [], None, 0.0
+        self.last_cpu = {}  # pid -> 마지막 CPU 초 (끝난 프로세스 몫도 합계에 남음)
+        self.halt = threading.Event()
+
+    def run(self):
+        start, prev_t, prev_cpu = time.time(), time.time(), 0.0
+        while not self.halt.wait(self.interval):
+            rss = 0
+            for pid in self.pids_fn():
+                usage = proc_usage(pid)
+                if usage: self.last_cpu[pid], rss = usage[0], rss + usage[1]
+            now, cpu = time.time(), sum(self.last_cpu.values())
+            self.samples.append({"t": round(now - start, 2), "cpu_pct": round((cpu - prev_cpu) / (now - prev_t) * 100, 1),
+                                 "rss_mb": round(rss / 1048576, 1), "fps": self.fps})
+            prev_t, prev_cpu, self.cpu_total = now, cpu, cpu
+
+    def stop(self):
+        self.halt.set(); self.join(timeout=2)
+
+def update_metrics(path, record):
+    # 텍스트 파일 수집기용 누적 지표 (기존 파일 값을 읽어 더한 뒤 원자적으로 교체)
+    with _metrics_lock:
+        values = {}
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.strip() and not line.startswith("#"):
+                        key, _, value = line.rstrip().rpartition(" ")
+                        values[key] = int(value) if value.lstrip("-").isdigit() else float(value)
+        except (OSError, ValueError): pass
+
+        def add(key, v): values[key] = values.get(key, 0) + v
+        add(f'dme_jobs_total{{status="{record["status"]}"}}', 1)
+        add("dme_frames_total", record["frames"] or 0)
+        add("dme_job_seconds_total", record["wall_s"])
+        add("dme_cpu_seconds_total", record["cpu_s"] or 0)
+        for stage, sec in record["stages"].items(): add(f'dme_stage_seconds_total{{stage="{stage}"}}', sec)
+        if record["status"] == "done":
+            values["dme_last_job_fps"] = record["fps"] or 0
+            values["dme_last_job_peak_rss_bytes"] = (record["peak_rss_mb"] or 0) * 1048576
+        # 다음 갱신 때 다시 읽어 더하므로 반올림하지 않음 (정수는 그대로, 실수는 repr)
+        lines = []
+        for name, (kind, text) in METRICS_HELP.items():
+            keys = sorted(k for k in values if k == name or k.startswith(name + "{"))
+            if not keys: continue
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"] + [f"{k} {values[k]!r}" for k in keys]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f: f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+class ProfiledJob:
+    # 다른 작업을 감싸 실행 기록(<출력>.run.json)을 남기고, metrics_file이 있으면 지표를 누적
+    def __init__(self, job):
+        self.job, self.params = job, job.params
+        self.inner = job.job if isinstance(job, CachedJob) else job
+
+    @property
+    def is_running(self): return self.job.is_running
+
+    def pids(self):
+        procs = [self.inner.process, getattr(self.inner, "decoder", None)] + list(getattr(self.inner, "processes", []))
+        return [p.pid for p in procs if p is not None and p.poll() is None]
+
+    def run(self):
+        stage_profile = None
+        if self.params.get('profile_stages') and not is_stream_path(self.params['input_path']):
+            with self.inner.timed("profile_stages"): stage_profile = profile_filter_stages(self.params, self.params['profile_stages'])
+        sampler = ProcessSampler(self.pids); sampler.start()
+        started, last_stats, final, outputs = time.time(), {}, None, []
+        try:
+            for kind, value in self.job.run():
+                if kind == "stats": last_stats = value; sampler.fps = value.get("fps")
+                if kind in ("done", "error", "cancelled"):
+                    final = (kind, value)
+                    if kind == "done": outputs = value if isinstance(value, list) else [value]
+                    continue  # 기록을 남긴 뒤에 내보냄
+                yield (kind, value)
+        finally:
+            sampler.stop()
+        wall = time.time() - started
+        frames = last_stats.get("frame")
+        bench = self.inner.bench
+        peak = max([s["rss_mb"] for s in sampler.samples] + [bench.get("maxrss_kb", 0) / 1024]) or None
+        record = {
+            "input": self.params['input_path'], "outputs": outputs, "status": final[0] if final else "cancelled",
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)), "wall_s": round(wall, 3),
+            "frames": frames, "fps": round(frames / wall, 2) if frames else None,
+            "cpu_s": round(sampler.cpu_total or (bench.get("utime", 0) + bench.get("stime", 0)), 3) or None,
+            "peak_rss_mb": peak and round(peak, 1),
+            "stages": {k: round(v, 4) for k, v in self.inner.stages.items()},
+            "ffmpeg_bench": {k: round(v, 4) for k, v in bench.items()}, "filter_stages": stage_profile,
+            "samples": sampler.samples, "params": self.params,
+        }
+        for out in outputs[:1]:
+            if out and out != "<stdout>":
+                try:
+                    with open(f"{out}.run.json", 'w', encoding='utf-8') as f: json.dump(record, f, indent=1)
+                except OSError: pass
+        if self.params.get('metrics_file'):
+            try: update_metrics(self.params['metrics_file'], record)
+            except OSError as e: yield ("log", f"Metrics write failed: {e}")
+        if final and final[0] == "done":
+            parts = [f"{k} {v:.2f}s" for k, v in record["stages"].items()]
+            if record["cpu_s"]: parts.append(f"CPU {record['cpu_s']:.1f}s")
+            if record["peak_rss_mb"]: parts.append(f"RSS {record['peak_rss_mb']:.0f}MB")
+            yield ("log", "⏱ " + " / ".join(parts))
+        if final: yield final
+
+    def stop(self): self.job.stop()
+
+# ==========================================
+# 인코더 기능 탐지 (ffmpeg 경로 + mtime별로 디스크에 캐시, 바이너리가 바뀔 때만 다시 확인)
+# ==========================================
+CAPS_PATH = os.path.join(os.path.expanduser("~"), ".dme", "ffmpeg_caps.json")
+X26X_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+NVENC_PRESETS = ["p1", "p2", "p3", "p4", "p5", "p6", "p7", "fast", "medium", "slow"]
+CODEC_PRESETS = {"libx265": X26X_PRESETS, "libx264": X26X_PRESETS, "hevc_nvenc": NVENC_PRESETS, "h264_nvenc": NVENC_PRESETS}
+CALIBRATION_PRESETS = {"libx265": "medium", "libx264": "medium", "hevc_nvenc": "p4", "h264_nvenc": "p4"}  # 서로 비슷한 품질대
+REQUIRED_FILTERS = ("crop", "scale", "format", "gblur", "bilateral")
+CALIBRATION_SECONDS = 1.0
+_caps_lock = threading.Lock()
+
+def _caps_key(ffmpeg_path):
+    path = os.path.realpath(ffmpeg_path)
+    try: return f"{path}|{os.stat(path).st_mtime_ns}"
+    except OSError: return None
+
+def _load_caps():
+    try:
+        with open(CAPS_PATH, 'r', encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError): return {}
+
+def _save_caps(key, caps):
+    # 다른 바이너리의 항목은 그대로 두고 이 키만 갱신
+    data = _load_caps(); data[key] = caps
+    folder = os.path.dirname(CAPS_PATH)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(CAPS_PATH) + ".", suffix=".tmp", dir=folder)
+    except OSError: return  # 캐시를 못 쓰면 다음 실행에서 다시 탐지
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f: json.dump(data, f, indent=1)
+        os.replace(tmp, CAPS_PATH)
+    except OSError:
+        remove_partial(tmp)
+
+def _ffmpeg_lines(ffmpeg_path, *args):
+    try:
+        return subprocess.run([ffmpeg_path, "-hide_banner", *args], capture_output=True, text=True, timeout=30,
+                              creationflags=CREATION_FLAGS).stdout.splitlines()
+    except (OSError, subprocess.TimeoutExpired): return []
+
+def encoder_presets(ffmpeg_path, codec):
+    # -preset이 상수 목록인 인코더(NVENC 등)는 도움말에서 실제 값을 읽고, 문자열(x264/x265)이면 알려진 목록 사용
+    known, found, in_preset = CODEC_PRESETS.get(codec, []), [], False
+    for line in _ffmpeg_lines(ffmpeg_path, "-h", f"encoder={codec}"):
+        if re.match(r"^\s+-\w", line): in_preset = line.split()[0] == "-preset"
+        elif in_preset and line.strip(): found.append(line.split()[0])
+    return [p for p in known if p in found] if found else list(known)
+
+def ffmpeg_capabilities(ffmpeg_path, refresh=False):
+    # -> {"version", "listed": 빌드에 있는 모든 영상 인코더, "encoders": 시험 인코딩에 성공한 주요 코덱,
+    #     "failed": 목록에는 있지만 시험 인코딩이 실패한 주요 코덱, "presets", "filters": 있는 필수 필터, "calibration"}
+    key = _caps_key(ffmpeg_path)
+    if key is None: return None
+    with _caps_lock:
+        caps = None if refresh else _load_caps().get(key)
+        if caps: return caps
+        # " V....D libx264  설명" 형식. 머리말의 " V..... = Video"는 제외
+        listed = {p[1] for p in map(str.split, _ffmpeg_lines(ffmpeg_path, "-encoders"))
+                  if len(p) > 1 and len(p[0]) == 6 and p[0].startswith("V") and p[1] != "="}
+        filters = {line.split()[1] for line in _ffmpeg_lines(ffmpeg_path, "-filters") if len(line.split()) > 2}
+        # 빌드에 포함된 하드웨어 인코더도 장치가 없으면 실패하므로 encoder_available로 한 번 더 확인
+        encoders = [c for c in CODEC_PRESETS if c in listed and encoder_available(ffmpeg_path, c)]
+        caps = {"version": ffmpeg_version(ffmpeg_path), "listed": sorted(listed), "encoders": encoders,
+                "failed": [c for c in CODEC_PRESETS if c in listed and c not in encoders],
+                "presets": {c: encoder_presets(ffmpeg_path, c) for c in encoders},
+                "filters": [f for f in REQUIRED_FILTERS if f in filters], "calibration": {}}
+        if listed: _save_caps(key, caps)  # 목록을 못 읽었으면(일시적 실패 등) 캐시하지 않고 다음에 다시 탐지
+        return caps
+
+def cached_capabilities(ffmpeg_path):
+    # 디스크 캐시만 확인 (없으면 None, ffmpeg를 실행하지 않음)
+    key = _caps_key(ffmpeg_path) if ffmpeg_path else None
+    return _load_caps().get(key) if key else None
+
+def calibrate_encoders(ffmpeg_path, crf, refresh=False):
+    # 목표 품질(crf)에서 사용 가능한 인코더별로 짧은 합성 영상을 인코딩해 가장 빠른 조합을 고름 (결과는 캐시)
+    caps = ffmpeg_capabilities(ffmpeg_path)
+    if not caps or not caps["encoders"]: return None
+    pick = None if refresh else caps["calibration"].get(str(crf))
+    if pick: return pick
+    src = f"testsrc2=s=960x540:r=24:d={CALIBRATION_SECONDS},format=yuv420p"
+    frames, fps = int(CALIBRATION_SECONDS * 24), {}
+    for codec in caps["encoders"]:
+        cmd = [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", src]
+        cmd += encoder_args({'codec': codec, 'preset': CALIBRATION_PRESETS[codec], 'crf': crf}) + ["-f", "null", "-"]
+        start = time.perf_counter()
+        try: ok = subprocess.run(cmd, capture_output=True, timeout=120, creationflags=CREATION_FLAGS).returncode == 0
+        except (OSError, subprocess.TimeoutExpired): ok = False
+        if ok: fps[codec] = round(frames / (time.perf_counter() - start), 1)
+    if not fps: return None
+    best = max(fps, key=fps.get)
+    pick = {"codec": best, "preset": CALIBRATION_PRESETS[best], "jobs": default_concurrency(best), "fps": fps}
+    with _caps_lock:
+        key = _caps_key(ffmpeg_path)
+        caps = _load_caps().get(key, caps); caps["calibration"][str(crf)] = pick
+        _save_caps(key, caps)
+    return pick
+
+def resolve_codec(params):
+    # codec "auto" -> 보정 결과의 코덱/프리셋 (작업을 실행하는 노드의 ffmpeg 기준) -> (params, 경고 목록)
+    # 탐지 결과가 캐시돼 있으면 빌드에 아예 없는 인코더만 거부하고, 시험 인코딩 실패(장치 없음, 세션 한도 등)는 경고만
+    if params.get('ext') in EXPORT_EXTS: return params, []
+    codecs = {params['codec']} | {v['codec'] for v in params.get('variants') or [] if 'codec' in v}
+    caps, notes = cached_capabilities(params['ffmpeg_path']), []
+    if caps and caps.get("listed"):
+        bad = sorted(c for c in codecs if c != "auto" and c not in caps["listed"])
+        if bad: raise ValueError(f"Encoder not in this ffmpeg build: {', '.join(bad)}")
+        notes += [f"{c} failed a test encode when ffmpeg was probed; trying anyway (--refresh-caps to re-check)"
+                  for c in sorted(codecs) if c in caps.get("failed", [])]
+    elif caps and codecs - {"auto"}:
+        notes.append("Could not read the encoder list from ffmpeg; codec not verified.")
+    if "auto" not in codecs: return params, notes
+    pick = calibrate_encoders(params['ffmpeg_path'], params['crf'])
+    if not pick: raise ValueError("No usable encoder found for codec 'auto'.")
+    params = dict(params)
+    if params['codec'] == "auto": params.update(codec=pick["codec"], preset=pick["preset"])
+    if params.get('variants'):
+        params['variants'] = [dict(v, codec=pick["codec"], preset=pick["preset"]) if v.get('codec') == "auto" else v
+                              for v in params['variants']]
+    return params, notes
+
+class NoticeJob:
+    # 작업 시작 전에 경고를 로그로 먼저 내보냄
+    def __init__(self, job, notices):
+        self.job, self.params, self.notices = job, job.params, notices
+
+    @property
+    def is_running(self): return self.job.is_running
+
+    def run(self):
+        for note in self.notices: yield ("log", f"⚠ {note}")
+        yield from self.job.run()
+
+    def stop(self): self.job.stop()
+
+def create_job(params, cache=None):
+    params, notices = resolve_codec(params)
+    job = build_job(params, cache)
+    if params.get('profile') or params.get('metrics_file'): job = ProfiledJob(job)
+    return NoticeJob(job, notices) if notices else job
+
+def build_job(params, cache=None):
+    if params.get('ext') in EXPORT_EXTS:
+        from dme_export import ExportJob, SEQUENCE_EXTS
+        job = ExportJob(params)
+        # 이미지 시퀀스(폴더)는 캐시/링크 대상이 아님
+        return CachedJob(job, cache) if params.get('cache', True) and params['ext'] not in SEQUENCE_EXTS else job
+    if is_stream_path(params['input_path']) or params['output_folder'] == "-": return StreamEncodeJob(params)
+    if params.get('variants'):
+        return SweepEncodeJob(params, (cache or shared_cache()) if params.get('cache', True) else None)
+    if params.get('engine', "ffmpeg") == "numpy" and params['use_filter']:
+        from dme_numpy import NumpyEncodeJob
+        job = NumpyEncodeJob(params)
+    elif params.get('segments', 0) > 1: job = SegmentedEncodeJob(params)
+    else: job = EncodeJob(params)
+    return CachedJob(job, cache) if params.get('cache', True) else job
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import shutil
+import threading
+import subprocess
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dme_core import (EncodeJob, CREATION_FLAGS, ProgressTracker, StderrReader, probe_media, fps_value,
+                      filter_stages, plan_cost, get_unique_path, output_suffix, remove_partial, is_stream_path)
+
+try:
+    import numpy as np
+except ImportError:  # 읽기(open_depth_stack)에만 필요. 내보내기는 numpy 없이 동작
+    np = None
+
+# ==========================================
+# 16비트 깊이 내보내기 (영상 대신 원시 프레임 묶음 / 이미지 시퀀스)
+# ==========================================
+# ffmpeg가 crop -> gray16 -> 필터 -> scale 결과를 gray16le 원시 프레임으로 내보내고,
+# 프레임은 받는 즉시 파일(또는 이미지 작성 풀)로 넘겨 메모리에 쌓지 않음.
+#   npy : NumPy .npy (uint16, [프레임, 세로, 가로]) + 같은 이름의 .json (fps 등)
+#   raw : 32바이트 머리말(DMEDEPTH, 버전, 프레임 수, 가로, 세로, fps) + uint16 LE 프레임
+#   png / tiff : 폴더 안에 000000.png ... (16비트 흑백)
+SEQUENCE_EXTS = ("png", "tiff")
+RAW_MAGIC = b"DMEDEPTH"
+RAW_HEADER = struct.Struct("<8sIIIId")  # magic, 버전, 프레임 수, 가로, 세로, fps
+NPY_HEADER_SIZE = 128  # 프레임 수를 끝에 채워 넣도록 고정 길이 머리말 사용
+PNG_LEVEL = 3
+
+def export_chain(params, src_size):
+    # 흑백 경로(planner의 gray=True)를 16비트로: 필터 계산이 8비트로 반올림되지 않음
+    candidates = [filter_stages(params, src_size, scale_first=False, gray=True)]
+    if params.get('plan_mode') == "fast" and params['res_mode'] != "none" and params['use_filter']:
+        candidates.append(filter_stages(params, src_size, scale_first=True, gray=True))
+    stages = min(candidates, key=plan_cost)
+    chain = []
+    for name, args, *_ in stages:
+        if name == "format": args = "gray16le" if args == "gray" else None
+        if args is not None: chain.append(f"{name}={args}")
+    return chain
+
+def npy_header(frames, h, w):
+    d = f"{{'descr': '<u2', 'fortran_order': False, 'shape': ({frames}, {h}, {w}), }}"
+    d = d.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(d)) + d.encode('latin1')
+
+def png_bytes(data, w, h):
+    # 16비트 흑백 PNG. PNG는 빅엔디언이라 바이트 순서를 바꾸고, 각 행 앞에 필터 0(None)
+    px = array('H'); px.frombytes(data)
+    if sys.byteorder == "little": px.byteswap()
+    raw, stride = px.tobytes(), w * 2
+    rows = b"".join(b"\x00" + raw[y * stride:(y + 1) * stride] for y in range(h))
+
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 16, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, PNG_LEVEL)) + chunk(b"IEND", b""))
+
+def tiff_bytes(data, w, h):
+    # 무압축 리틀엔디언 16비트 흑백 TIFF (스트립 1개)
+    entries = [(256, 4, w), (257, 4, h), (258, 3, 16), (259, 3, 1), (262, 3, 1), (273, 4, 0),
+               (277, 3, 1), (278, 4, h), (279, 4, len(data))]
+    offset = 8 + 2 + len(entries) * 12 + 4
+    ifd = struct.pack("<H", len(entries)) + b"".join(
+        struct.pack("<HHII", tag, kind, 1, offset if tag == 273 else value) for tag, kind, value in entries)
+    return b"II*\x00" + struct.pack("<I", 8) + ifd + struct.pack("<I", 0) + bytes(data)
+
+class StackWriter:
+    # 프레임을 순서대로 파일 끝에 붙이고, 프레임 수는 마지막에 머리말에 기록
+    def __init__(self, path, ext, w, h, fps):
+        self.path, self.ext, self.w, self.h, self.fps = path, ext, w, h, fps
+        self.header_size = NPY_HEADER_SIZE if ext == "npy" else RAW_HEADER.size
+        self.f = open(path, 'wb'); self.f.write(b"\0" * self.header_size)
+
+    def write(self, index, frame): self.f.write(frame)
+
+    def close(self, frames):
+        self.f.seek(0)
+        if self.ext == "npy": self.f.write(npy_header(frames, self.h, self.w))
+        else: self.f.write(RAW_HEADER.pack(RAW_MAGIC, 1, frames, self.w, self.h, self.fps))
+        self.f.close()
+        if self.ext == "npy":
+            with open(os.path.splitext(self.path)[0] + ".json", 'w') as f:
+                json.dump({"frames": frames, "width": self.w, "height": self.h, "fps": self.fps}, f)
+
+    def abort(self):
+        self.f.close(); remove_partial(self.path)
+
+class SequenceWriter:
+    # 압축/쓰기를 작업 스레드 풀에서 병렬로 (zlib은 GIL을 놓음). 대기 프레임 수를 제한해 메모리 사용을 묶음
+    def __init__(self, folder, ext, w, h, workers):
+        self.folder, self.ext, self.w, self.h = folder, ext, w, h
+        os.makedirs(folder, exist_ok=True)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.Semaphore(workers * 2)
+        self.error = None
+
+    def save(self, index, frame):
+        try:
+            data = png_bytes(frame, self.w, self.h) if self.ext == "png" else tiff_bytes(frame, self.w, self.h)
+            with open(os.path.join(self.folder, f"{index:06d}.{self.ext}"), 'wb') as f: f.write(data)
+        except OSError as e: self.error = self.error or e
+        finally: self.slots.release()
+
+    def write(self, index, frame):
+        if self.error: raise self.error
+        self.slots.acquire()
+        self.pool.submit(self.save, index, frame)
+
+    def close(self, frames):
+        self.pool.shutdown(wait=True)
+        if self.error: raise self.error
+        with open(os.path.join(self.folder, "info.json"), 'w') as f:
+            json.dump({"frames": frames, "width": self.w, "height": self.h, "format": self.ext}, f)
+
+    def abort(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+def open_depth_stack(path):
+    # 내보낸 npy/raw를 복사 없이 메모리 매핑 -> (배열[프레임, 세로, 가로], 정보)
+    if np is None: raise RuntimeError("Reading depth stacks requires numpy (pip install numpy).")
+    if path.lower().endswith(".npy"):
+        stack = np.load(path, mmap_mode='r')
+        try:
+            with open(os.path.splitext(path)[0] + ".json", 'r') as f: info = json.load(f)
+        except (OSError, ValueError): info = {}
+        return stack, dict(info, frames=stack.shape[0], height=stack.shape[1], width=stack.shape[2])
+    with open(path, 'rb') as f: magic, version, frames, w, h, fps = RAW_HEADER.unpack(f.read(RAW_HEADER.size))
+    if magic != RAW_MAGIC: raise ValueError(f"Not a DME depth stack: {path}")
+    stack = np.memmap(path, dtype='<u2', mode='r', offset=RAW_HEADER.size, shape=(frames, h, w))
+    return stack, {"frames": frames, "width": w, "height": h, "fps": fps, "version": version}
+
+class ExportJob(EncodeJob):
+    def prepare(self):
+        filename = os.path.basename(self.params['input_path'])
+        name_only, _ = os.path.splitext(filename)
+        base, ext = f"{name_only}{output_suffix(self.params)}", self.params['ext']
+        # 시퀀스는 폴더 (예: clip_G0.50_S0.020_png/000000.png)
+        if ext in SEQUENCE_EXTS: self.output_path = get_unique_path(self.params['output_folder'], f"{base}_{ext}", None)
+        else: self.output_path = get_unique_path(self.params['output_folder'], base, ext)
+        return filename
+
+    def run(self):
+        ffmpeg_path, input_path, ext = self.params['ffmpeg_path'], self.params['input_path'], self.params['ext']
+        if is_stream_path(input_path):
+            yield ("error", "16-bit export needs a seekable input file, not a stream."); return
+        with self.timed("probe"): info = probe_media(ffmpeg_path, input_path)
+        if not info:
+            yield ("error", f"Cannot read video size/fps: {os.path.basename(input_path)}"); return
+        res = self.params['res_mode']
+        w, h = (int(res), int(res)) if res != "none" else (info["width"] // 2, info["height"])
+        fps = fps_value(info["fps"])
+        filename = self.prepare()
+        cmd = [ffmpeg_path, "-v", "error", "-i", input_path, "-vf", ",".join(export_chain(self.params, (info["width"], info["height"]))),
+               "-f", "rawvideo", "-pix_fmt", "gray16le", "-"]
+        yield ("log", f"▶ Start Processing: {filename} (16-bit {ext})")
+
+        workers = max(1, self.params.get('threads') or os.cpu_count() or 1)
+        if ext in SEQUENCE_EXTS: writer = SequenceWriter(self.output_path, ext, w, h, workers)
+        else: writer = StackWriter(self.output_path, ext, w, h, fps)
+        process = self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                                  creationflags=CREATION_FLAGS, bufsize=0)
+        if not self.is_running: process.kill()
+        err = StderrReader(process.stderr); err.start()
+        tracker = ProgressTracker(info["duration"], info.get("frames", 0))
+        frame_bytes, frames, failure = w * h * 2, 0, None
+        started = time.perf_counter()
+        try:
+            while self.is_running:
+                # 시퀀스는 작업 스레드가 버퍼를 가져가므로 프레임마다 새 버퍼
+                frame = bytearray(frame_bytes)
+                view, filled = memoryview(frame), 0
+                while filled < frame_bytes:
+                    got = process.stdout.readinto(view[filled:])
+                    if not got: break
+                    filled += got
+                if filled < frame_bytes: break
+                writer.write(frames, frame)
+                frames += 1
+                yield from tracker.update(seconds=frames / fps if fps else None, frame=frames)
+        except OSError as e:
+            failure = str(e)
+        finally:
+            if failure or not self.is_running: process.kill()
+        process.wait(); err.join(timeout=2)
+        self.stages["decode_write"] = time.perf_counter() - started
+
+        if not self.is_running:
+            writer.abort(); yield ("cancelled", None); return
+        if failure or process.returncode != 0:
+            writer.abort()
+            yield ("error", f"FFmpeg exited with code {process.returncode}: {filename}\n" + (failure or "\n".join(list(err.tail)[-5:])))
+            return
+        try: writer.close(frames)
+        except OSError as e:
+            writer.abort(); yield ("error", f"Write failed: {e}"); return
+        yield ("log", f"{frames} frames, {w}x{h}, uint16")
+        yield ("progress", 100)
+        yield ("done", self.output_path)
@@ -0,0 +1,378 @@
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import itertools
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dme_core import create_job, find_ffmpeg, default_concurrency, is_stream_path, DEFAULT_PARAMS
+
+# ==========================================
+# DME 분산 처리 (코디네이터 1대 + 여러 노드의 작업자, HTTP/JSON)
+# ==========================================
+# 코디네이터: python dme_farm.py coordinator --port 8765
+# 작업자:     python dme_farm.py worker http://host:8765 --slots 2 [--map D:/share=/mnt/share]
+# 제출:       python dme_cli.py <입력> -o <출력> --farm http://host:8765  (또는 GUI의 Farm URL)
+# 입력/출력 경로는 모든 노드가 보는 공유 저장소여야 하며, 마운트 위치가 다르면 --map으로 바꿈.
+#
+# 작업자는 HEARTBEAT_INTERVAL마다 진행 상황을 보내고 새 작업을 받아감. WORKER_TIMEOUT 동안
+# 소식이 없으면 죽은 것으로 보고 그 작업을 다시 대기열에 넣음 (MAX_ATTEMPTS회까지).
+DEFAULT_PORT = 8765
+HEARTBEAT_INTERVAL = 1.0
+WORKER_TIMEOUT = 10.0
+MAX_ATTEMPTS = 3
+LOG_KEEP = 50
+TERMINAL = ("done", "failed", "cancelled")
+LOST_JOB = "Coordinator lost this job (restarted?)"  # 제출한 id를 코디네이터가 모를 때 (작업 목록은 메모리에만 있음)
+# 작업자가 받아들이는 설정 (metrics_file/profile 등 작업자 노드의 임의 경로에 쓰는 키는 버림)
+JOB_KEYS = set(DEFAULT_PARAMS) | {'input_path', 'output_folder', 'sigmar', 'variants', 'threads'}
+
+class Coordinator:
+    def __init__(self, worker_timeout=WORKER_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        self.worker_timeout, self.max_attempts = worker_timeout, max_attempts
+        self.lock = threading.Lock()
+        self.jobs, self.order, self.workers = {}, [], {}
+        self.job_ids, self.worker_ids = itertools.count(1), itertools.count(1)
+        self.epoch = f"{int(time.time()):x}"  # 재시작 후 새 작업이 예전 id를 다시 쓰지 않도록 id 앞에 붙임
+
+    def public(self, job):
+        return {k: (list(v) if k == "log" else v) for k, v in job.items() if k not in ("params", "cancel")}
+
+    def add_log(self, job, lines):
+        # log_seq: 지금까지 쌓인 줄 수 (클라이언트가 새 줄만 골라냄. 오래된 줄은 LOG_KEEP 이후 버림)
+        job["log"].extend(lines); job["log_seq"] += len(lines)
+
+    def submit(self, params):
+        with self.lock:
+            jid = f"{self.epoch}-{next(self.job_ids)}"
+            self.jobs[jid] = {"id": jid, "input": params.get('input_path'), "params": params, "state": "queued",
+                              "progress": 0, "stats": {}, "worker": None, "attempts": 0, "outputs": [], "error": None,
+                              "metrics": {}, "log": deque(maxlen=LOG_KEEP), "log_seq": 0, "cancel": False,
+                              "submitted": time.time(), "started": None, "finished": None}
+            self.order.append(jid)
+            return self.public(self.jobs[jid])
+
+    def register(self, name, slots, host):
+        with self.lock:
+            wid = f"w{next(self.worker_ids)}"
+            self.workers[wid] = {"id": wid, "name": name, "host": host, "slots": max(1, int(slots)), "running": set(),
+                                 "last_seen": time.time(), "alive": True, "done": 0, "failed": 0}
+            return wid
+
+    def worker(self, wid):
+        w = self.workers.get(wid)
+        if w is None: raise KeyError(wid)
+        w["last_seen"], w["alive"] = time.time(), True
+        return w
+
+    def heartbeat(self, wid, reports):
+        # reports: 작업 id -> {"progress", "stats", "log": [새 줄]} / 응답: 취소할 작업 id 목록
+        # 취소된 작업과, 죽은 것으로 처리된 뒤 돌아온 작업자가 아직 돌리는(이미 재할당된) 작업도 멈추게 함
+        with self.lock:
+            w = self.worker(wid)
+            for jid, r in reports.items():
+                job = self.jobs.get(jid)
+                if job and job["state"] == "queued":  # 다시 할당되기 전에 돌아왔으면 그대로 이어서 맡김
+                    job.update(state="running", worker=wid); w["running"].add(jid)
+                    self.add_log(job, [f"Worker {w['name']} is back; continuing"])
+                if not job or job["worker"] != wid or job["state"] != "running": continue
+                job["progress"], job["stats"] = r.get("progress", job["progress"]), r.get("stats") or job["stats"]
+                self.add_log(job, r.get("log", []))
+            return [jid for jid in reports
+                    if jid not in self.jobs or self.jobs[jid]["worker"] != wid or self.jobs[jid]["state"] != "running"]
+
+    def lease(self, wid, free):
+        with self.lock:
+            w = self.worker(wid)
+            free = min(free, w["slots"] - len(w["running"]))
+            leased = []
+            for jid in self.order:
+                if len(leased) >= free: break
+                job = self.jobs[jid]
+                if job["state"] != "queued": continue
+                job.update(state="running", worker=wid, attempts=job["attempts"] + 1, started=time.time(), progress=0)
+                w["running"].add(jid)
+                leased.append({"id": jid, "params": job["params"]})
+            return leased
+
+    def report(self, wid, jid, state, outputs=None, error=None, metrics=None, log=None):
+        with self.lock:
+            w = self.worker(wid)
+            w["running"].discard(jid)
+            job = self.jobs.get(jid)
+            if not job or job["worker"] != wid or job["state"] != "running": return  # 이미 재할당/취소된 작업
+            self.add_log(job, log or [])
+            if state == "cancelled" and not job["cancel"]:
+                state, error = "failed", error or "Cancelled on worker"
+            job.update(state=state, outputs=outputs or [], error=error, metrics=metrics or {}, finished=time.time())
+            if state == "done": job["progress"] = 100; w["done"] += 1
+            elif state == "failed": w["failed"] += 1
+
+    def cancel(self, jid):
+        with self.lock:
+            job = self.jobs.get(jid)
+            if not job or job["state"] in TERMINAL: return False
+            # 실행 중이면 다음 heartbeat 응답으로 작업자에 전달. 슬롯은 작업자가 결과를 보고할 때 비움
+            job.update(cancel=True, state="cancelled", finished=time.time())
+            return True
+
+    def reap(self):
+        # 소식이 끊긴 작업자의 작업을 다시 대기열로
+        now = time.time()
+        with self.lock:
+            for w in self.workers.values():
+                if not w["alive"] or now - w["last_seen"] < self.worker_timeout: continue
+                w["alive"] = False
+                for jid in list(w["running"]):
+                    job = self.jobs[jid]
+                    w["running"].discard(jid)
+                    if job["state"] != "running": continue
+                    self.add_log(job, [f"Worker {w['name']} lost; " + ("retrying" if job["attempts"] < self.max_attempts else "giving up")])
+                    if job["attempts"] < self.max_attempts: job.update(state="queued", worker=None, progress=0)
+                    else: job.update(state="failed", error="Worker lost", finished=time.time())
+
+    def snapshot(self, ids=None):
+        with self.lock:
+            return [self.public(self.jobs[j]) for j in (ids if ids is not None else self.order) if j in self.jobs]
+
+    def worker_list(self):
+        with self.lock:
+            return [dict(w, running=sorted(w["running"]), last_seen=round(time.time() - w["last_seen"], 1))
+                    for w in self.workers.values()]
+
+    def metrics_text(self):
+        with self.lock:
+            states = {}
+            for job in self.jobs.values(): states[job["state"]] = states.get(job["state"], 0) + 1
+            lines = ["# HELP dme_farm_jobs Jobs known to the coordinator by state.", "# TYPE dme_farm_jobs gauge"]
+            lines += [f'dme_farm_jobs{{state="{s}"}} {n}' for s, n in sorted(states.items())]
+            lines += ["# HELP dme_farm_worker_up Worker heartbeat is current.", "# TYPE dme_farm_worker_up gauge"]
+            lines += [f'dme_farm_worker_up{{worker="{w["name"]}"}} {int(w["alive"])}' for w in self.workers.values()]
+            lines += ["# HELP dme_farm_worker_jobs_total Jobs finished per worker.", "# TYPE dme_farm_worker_jobs_total counter"]
+            for w in self.workers.values():
+                lines += [f'dme_farm_worker_jobs_total{{worker="{w["name"]}",status="done"}} {w["done"]}',
+                          f'dme_farm_worker_jobs_total{{worker="{w["name"]}",status="failed"}} {w["failed"]}']
+            return "\n".join(lines) + "\n"
+
+def make_handler(coord, token):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+
+        def send(self, code, body, content_type="application/json"):
+            data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", content_type); self.send_header("Content-Length", str(len(data)))
+            self.end_headers(); self.wfile.write(data)
+
+        def route(self, method):
+            if token and self.headers.get("X-DME-Token") != token: return self.send(403, {"error": "bad token"})
+            length = int(self.headers.get("Content-Length") or 0)
+            try: body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            except ValueError: return self.send(400, {"error": "invalid JSON"})
+            path, _, query = self.path.partition("?")
+            parts = [p for p in path.split("/") if p]
+            try:
+                if method == "GET" and parts == ["jobs"]:
+                    ids = query[4:].split(",") if query.startswith("ids=") else None
+                    return self.send(200, {"jobs": coord.snapshot(ids)})
+                if method == "GET" and len(parts) == 2 and parts[0] == "jobs":
+                    jobs = coord.snapshot([parts[1]])
+                    return self.send(200, jobs[0]) if jobs else self.send(404, {"error": "no such job"})
+                if method == "GET" and parts == ["workers"]: return self.send(200, {"workers": coord.worker_list()})
+                if method == "GET" and parts == ["metrics"]: return self.send(200, coord.metrics_text(), "text/plain; version=0.0.4")
+                if method == "POST" and parts == ["jobs"]: return self.send(200, coord.submit(body["params"]))
+                if method == "POST" and len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                    return self.send(200, {"cancelled": coord.cancel(parts[1])})
+                if method == "POST" and parts == ["workers"]:
+                    wid = coord.register(body.get("name") or self.client_address[0], body.get("slots", 1), self.client_address[0])
+                    return self.send(200, {"worker": wid, "heartbeat": HEARTBEAT_INTERVAL})
+                if method == "POST" and len(parts) == 3 and parts[0] == "workers":
+                    wid, action = parts[1], parts[2]
+                    if action == "heartbeat": return self.send(200, {"cancel": coord.heartbeat(wid, body.get("jobs", {}))})
+                    if action == "lease": return self.send(200, {"jobs": coord.lease(wid, int(body.get("free", 1)))})
+                    if action == "result":
+                        coord.report(wid, body["id"], body["state"], body.get("outputs"), body.get("error"),
+                                     body.get("metrics"), body.get("log"))
+                        return self.send(200, {"ok": True})
+            except KeyError as e:
+                return self.send(404, {"error": f"unknown: {e}"})
+            return self.send(404, {"error": "not found"})
+
+        def do_GET(self): self.route("GET")
+        def do_POST(self): self.route("POST")
+    return Handler
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, token=None, coord=None):
+    # 백그라운드 스레드에서 코디네이터 실행 -> (서버, 코디네이터). 테스트/내장용
+    coord = coord or Coordinator()
+    server = ThreadingHTTPServer((host, port), make_handler(coord, token))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def reaper():
+        while True:
+            time.sleep(1.0); coord.reap()
+    threading.Thread(target=reaper, daemon=True).start()
+    return server, coord
+
+class FarmClient:
+    def __init__(self, url, token=None, timeout=5.0):
+        self.url, self.token, self.timeout = url.rstrip("/"), token, timeout
+
+    def call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.url + path, data=data, method=method, headers={"Content-Type": "application/json"})
+        if self.token: req.add_header("X-DME-Token", self.token)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp: return json.loads(resp.read())
+
+    def submit(self, params): return self.call("POST", "/jobs", {"params": params})["id"]
+    def jobs(self, ids=None): return self.call("GET", "/jobs" + (f"?ids={','.join(ids)}" if ids else ""))["jobs"]
+    def cancel(self, jid): return self.call("POST", f"/jobs/{jid}/cancel", {})["cancelled"]
+
+def map_path(path, path_map):
+    # 공유 저장소 경로를 이 노드의 마운트 위치로 바꿈 (앞부분 일치, 구분자 통일)
+    if not path: return path
+    norm = path.replace("\\", "/")
+    for src, dst in path_map:
+        prefix = src.replace("\\", "/").rstrip("/")
+        if norm.lower().startswith(prefix.lower() + "/") or norm.lower() == prefix.lower():
+            return dst.rstrip("/\\") + norm[len(prefix):]
+    return path
+
+class FarmWorker:
+    def __init__(self, url, slots, name=None, ffmpeg_path=None, token=None, path_map=()):
+        self.client = FarmClient(url, token)
+        self.slots, self.name = slots, name or socket.gethostname()
+        self.ffmpeg_path, self.path_map = ffmpeg_path, list(path_map)
+        self.lock, self.halt = threading.Lock(), threading.Event()
+        self.active = {}   # 작업 id -> {"job", "progress", "stats", "log"}
+        self.wid = None
+
+    def say(self, msg): print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+    def execute(self, jid, params):
+        params = {k: v for k, v in params.items() if k in JOB_KEYS}
+        params = dict(params, ffmpeg_path=self.ffmpeg_path,
+                      input_path=map_path(params['input_path'], self.path_map),
+                      output_folder=map_path(params['output_folder'], self.path_map))
+        state, outputs, error, started = "failed", [], None, time.time()
+        entry = self.active[jid]
+        try:
+            if is_stream_path(params['input_path']) or params['output_folder'] == "-":
+                raise ValueError("Farm jobs need an input file and an output folder on shared storage.")
+            job = entry["job"] = create_job(params)
+            if entry["cancel"]: job.stop()
+            for kind, value in job.run():
+                with self.lock:
+                    if kind == "progress": entry["progress"] = value
+                    elif kind == "stats": entry["stats"] = value
+                    elif kind == "log": entry["log"].append(value)
+                    elif kind == "error": error = value; entry["log"].append(value)
+                    elif kind == "done": state, outputs = "done", value if isinstance(value, list) else [value]
+                    elif kind == "cancelled": state = "cancelled"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        frames = entry["stats"].get("frame")
+        wall = time.time() - started
+        metrics = {"wall_s": round(wall, 3), "frames": frames, "fps": round(frames / wall, 2) if frames else None,
+                   "worker": self.name}
+        self.say(f"{'✔' if state == 'done' else '✖'} job {jid} {state} ({wall:.1f}s)")
+        for attempt in range(30):  # 코디네이터가 잠시 끊겨도 결과는 전달
+            try:
+                with self.lock: log, entry["log"] = entry["log"], []
+                self.client.call("POST", f"/workers/{self.wid}/result", {"id": jid, "state": state, "outputs": outputs,
+                                                                        "error": error, "metrics": metrics, "log": log})
+                break
+            except (OSError, urllib.error.URLError):
+                time.sleep(HEARTBEAT_INTERVAL)
+        with self.lock: self.active.pop(jid, None)
+
+    def register(self):
+        self.wid = self.client.call("POST", "/workers", {"name": self.name, "slots": self.slots})["worker"]
+        self.say(f"Registered as {self.wid} ({self.name}, {self.slots} slots)")
+
+    def tick(self):
+        with self.lock:
+            reports = {jid: {"progress": e["progress"], "stats": e["stats"], "log": e["log"]} for jid, e in self.active.items()}
+            for e in self.active.values(): e["log"] = []
+        for jid in self.client.call("POST", f"/workers/{self.wid}/heartbeat", {"jobs": reports})["cancel"]:
+            entry = self.active.get(jid)
+            if entry:
+                entry["cancel"] = True
+                if entry["job"]: entry["job"].stop()
+        free = self.slots - len(self.active)
+        if free <= 0: return
+        for item in self.client.call("POST", f"/workers/{self.wid}/lease", {"free": free})["jobs"]:
+            if item["id"] in self.active: continue  # 재할당 전에 돌아와 다시 받은 작업은 이미 실행 중
+            self.say(f"▶ job {item['id']}: {item['params'].get('input_path')}")
+            with self.lock: self.active[item["id"]] = {"job": None, "progress": 0, "stats": {}, "log": [], "cancel": False}
+            threading.Thread(target=self.execute, args=(item["id"], item["params"]), daemon=True).start()
+
+    def run(self):
+        while not self.halt.is_set():
+            try:
+                if self.wid is None: self.register()
+                self.tick()
+            except urllib.error.HTTPError as e:
+                if e.code == 404: self.wid = None  # 코디네이터가 재시작됨 -> 다시 등록
+                else: self.say(f"Coordinator error: {e}")
+            except (OSError, urllib.error.URLError, ValueError) as e:
+                self.say(f"Coordinator unreachable: {e}")
+            self.halt.wait(HEARTBEAT_INTERVAL)
+
+    def stop(self):
+        self.halt.set()
+        for e in list(self.active.values()):
+            if e["job"]: e["job"].stop()
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="dme-farm", description="Depth Map Extract (DME) - distributed coordinator/worker")
+    sub = p.add_subparsers(dest="mode", required=True)
+    c = sub.add_parser("coordinator", help="run the job coordinator")
+    c.add_argument("--host", default="127.0.0.1", help="bind address; anything but loopback requires --token (default 127.0.0.1)")
+    c.add_argument("--port", type=int, default=DEFAULT_PORT)
+    c.add_argument("--token", help="shared secret required in the X-DME-Token header")
+    c.add_argument("--worker-timeout", type=float, default=WORKER_TIMEOUT, help="seconds without heartbeat before a worker is dead")
+    c.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    w = sub.add_parser("worker", help="run a worker that pulls jobs from a coordinator")
+    w.add_argument("url", help="coordinator URL, e.g. http://host:8765")
+    w.add_argument("--slots", type=int, default=0, help="concurrent jobs on this node (0 = auto)")
+    w.add_argument("--name", help="worker name (default: hostname)")
+    w.add_argument("--ffmpeg", help="path to ffmpeg binary (default: auto-detect)")
+    w.add_argument("--token")
+    w.add_argument("--map", action="append", default=[], metavar="SRC=DST",
+                   help="rewrite shared-storage path prefixes for this node (repeatable)")
+    return p
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.mode == "coordinator":
+        if args.host not in ("127.0.0.1", "localhost", "::1") and not args.token:
+            print("--token is required when the coordinator listens on a network address.", file=sys.stderr); return 2
+        coord = Coordinator(args.worker_timeout, args.max_attempts)
+        server, _ = serve(args.host, args.port, args.token, coord)
+        print(f"Coordinator listening on http://{args.host}:{args.port}", flush=True)
+        try:
+            while True: time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown(); return 0
+    ffmpeg_path = args.ffmpeg or find_ffmpeg()
+    if not ffmpeg_path:
+        print("FFmpeg not found.", file=sys.stderr); return 2
+    path_map = []
+    for item in args.map:
+        src, sep, dst = item.partition("=")
+        if not sep: print(f"Invalid --map: {item}", file=sys.stderr); return 2
+        path_map.append((src, dst))
+    worker = FarmWorker(args.url, args.slots or default_concurrency("libx265"), args.name, ffmpeg_path, args.token, path_map)
+    try: worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+import os
+import math
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dme_core import (EncodeJob, CREATION_FLAGS, TV_TO_FULL, ProgressTracker, probe_media, fps_value,
+                      encoder_args, remove_partial, plan_filter_chain, compare_files)
+
+try:
+    import numpy as np
+except ImportError:  # numpy는 선택 의존성 (engine="numpy"일 때만 필요)
+    np = None
+
+# ==========================================
+# NumPy 뎁스 후처리 엔진
+# ==========================================
+# ffmpeg는 디코딩(crop + gray 변환)과 인코딩만 담당하고, gblur/bilateral은
+# 흑백 원시 프레임 묶음에 대해 NumPy로 계산함.
+#
+# 허용 오차: ffmpeg gblur(IIR 근사)와 bilateral(재귀 근사)은 정확한 가우시안/
+# 윈도우 bilateral과 계산 방식이 달라 완전히 같지 않음. 인코딩 전 Y 평면 기준으로
+# PSNR >= 40 dB, SSIM >= 0.99 이면 같은 결과로 간주 (check_engine 참고).
+ENGINE_TOLERANCE = {"psnr": 40.0, "ssim": 0.99}
+# 배치 크기는 메모리 예산으로 정함: 작업 스레드마다 float32 임시 버퍼 8장(32바이트/화소),
+# 입출력 슬롯은 (스레드 수 + 2) 쌍의 uint8 버퍼(2바이트/화소)를 배치 크기만큼 잡음.
+# 예산을 넘으면 스레드 수를 줄이고, 스레드 하나로도 넘으면 배치를 MIN_BATCH 아래로 줄임.
+BATCH_MEMORY = 1 << 30  # 배치 버퍼 전체 예산 (바이트)
+MIN_BATCH, MAX_BATCH = 4, 64  # 큰 프레임도 되도록 묶어서 처리하도록 하한을 둠
+MAX_BILATERAL_RADIUS = 8
+
+def batch_bytes(frame_bytes, workers, batch):
+    return batch * frame_bytes * (32 * workers + 2 * (workers + 2))
+
+def batch_plan(frame_bytes, workers):
+    # (스레드 수, 배치 크기): batch_bytes가 BATCH_MEMORY 안에 들도록 맞춤 (스레드 1개, 배치 1로도 넘는 큰 프레임은 최소 구성으로 처리)
+    fit = (BATCH_MEMORY // (MIN_BATCH * frame_bytes) - 4) // 34
+    workers = max(1, min(workers, fit))
+    batch = BATCH_MEMORY // batch_bytes(frame_bytes, workers, 1)
+    return workers, min(MAX_BATCH, max(1, batch))
+
+def gaussian_kernel(sigma):
+    if sigma <= 0: return np.ones(1, np.float32)
+    r = max(1, int(math.ceil(3 * sigma)))
+    x = np.arange(-r, r + 1, dtype=np.float32)
+    k = np.exp(-(x * x) / (2 * sigma * sigma))
+    return (k / k.sum()).astype(np.float32)
+
+class BatchFilter:
+    # 작업 스레드마다 하나씩 두고 임시 버퍼를 재사용 (프레임마다 할당하지 않음)
+    def __init__(self, shape, sx, sy, sigma_s, sigma_r):
+        b, h, w = shape
+        self.kx, self.ky = gaussian_kernel(sx), gaussian_kernel(sy)
+        self.rx, self.ry = len(self.kx) // 2, len(self.ky) // 2
+        self.rb = min(MAX_BILATERAL_RADIUS, int(math.ceil(2 * sigma_s))) if sigma_s > 0 and sigma_r > 0 else 0
+        self.range_coef = -1.0 / (2 * sigma_r * sigma_r) if self.rb else 0.0
+        self.offsets = [(dy, dx, math.exp(-(dx * dx + dy * dy) / (2 * sigma_s * sigma_s)))
+                        for dy in range(-self.rb, self.rb + 1) for dx in range(-self.rb, self.rb + 1)] if self.rb else []
+        self.cur = np.empty(shape, np.float32)
+        self.acc = np.empty(shape, np.float32)
+        self.tmp = np.empty(shape, np.float32)
+        self.wsum = np.empty(shape, np.float32)
+        self.diff = np.empty(shape, np.float32)
+        self.pad_x = np.empty((b, h, w + 2 * self.rx), np.float32)
+        self.pad_y = np.empty((b, h + 2 * self.ry, w), np.float32)
+        self.pad_b = np.empty((b, h + 2 * self.rb, w + 2 * self.rb), np.float32)
+
+    @staticmethod
+    def fill_pad(pad, src, ry, rx):
+        # 가장자리 복제 패딩
+        h, w = src.shape[1:]
+        pad[:, ry:ry + h, rx:rx + w] = src
+        if rx:
+            pad[:, ry:ry + h, :rx] = src[:, :, :1]; pad[:, ry:ry + h, rx + w:] = src[:, :, -1:]
+        if ry:
+            pad[:, :ry, :] = pad[:, ry:ry + 1, :]; pad[:, ry + h:, :] = pad[:, ry + h - 1:ry + h, :]
+
+    def convolve(self, n, kernel, r, axis):
+        cur, acc, tmp = self.cur[:n], self.acc[:n], self.tmp[:n]
+        h, w = cur.shape[1:]
+        pad = self.pad_x[:n] if axis == 2 else self.pad_y[:n]
+        self.fill_pad(pad, cur, r if axis == 1 else 0, r if axis == 2 else 0)
+        acc.fill(0)
+        for i, k in enumerate(kernel):
+            view = pad[:, :, i:i + w] if axis == 2 else pad[:, i:i + h, :]
+            np.multiply(view, k, out=tmp); acc += tmp
+        cur[...] = acc
+
+    def bilateral(self, n):
+        cur, acc, tmp, wsum, diff = self.cur[:n], self.acc[:n], self.tmp[:n], self.wsum[:n], self.diff[:n]
+        h, w = cur.shape[1:]
+        r = self.rb
+        pad = self.pad_b[:n]; self.fill_pad(pad, cur, r, r)
+        acc.fill(0); wsum.fill(0)
+        for dy, dx, ws in self.offsets:
+            nb = pad[:, r + dy:r + dy + h, r + dx:r + dx + w]
+            np.subtract(nb, cur, out=diff); np.square(diff, out=diff)
+            np.multiply(diff, self.range_coef, out=diff); np.exp(diff, out=diff)
+            diff *= ws
+            np.multiply(diff, nb, out=tmp); acc += tmp; wsum += diff
+        np.divide(acc, wsum, out=cur)
+
+    def apply(self, frames, n, out):
+        cur = self.cur[:n]
+        np.multiply(frames[:n], 1.0 / 255.0, out=cur)
+        if self.rx: self.convolve(n, self.kx, self.rx, axis=2)
+        if self.ry: self.convolve(n, self.ky, self.ry, axis=1)
+        if self.rb: self.bilateral(n)
+        np.multiply(cur, 255.0, out=cur); cur += 0.5
+        np.clip(cur, 0, 255, out=cur)
+        out[:n] = cur  # float32 -> uint8 (버림 = 반올림, 위에서 0.5 더함)
+
+def numpy_plan(params, info):
+    # (디코더 체인, 필터 대상 크기, sigma x/y, sigmaS, sigmaR, 인코더 체인)
+    w, h = info["width"] // 2, info["height"]
+    res = params['res_mode']
+    decode, encode = ["crop=iw/2:ih:iw/2:0", "format=gray"], []
+    blur = params['blur']
+    sx = sy = blur
+    scale_first = (params.get('plan_mode', "exact") == "fast" and res != "none"
+                   and int(res) * int(res) < w * h)
+    if scale_first:
+        # 빠른 계획: 먼저 축소하고 sigma를 축소 비율에 맞게 환산 (plan_filter_chain과 동일)
+        sx, sy = blur * int(res) / w, blur * int(res) / h
+        decode.append(f"scale={res}:{res}"); w, h = int(res), int(res)
+    elif res != "none":
+        encode.append(f"scale={res}:{res}")
+    if params.get('aspect_ratio', "NONE") != "NONE": encode.append(f"setdar={params['aspect_ratio']}")
+    encode.append("format=yuv420p")
+    sigma_r = min(params['sigmar'] * TV_TO_FULL, 1.0)  # format=gray 전체 범위 기준으로 환산
+    return decode, (w, h), sx, sy, math.sqrt(sx * sy), sigma_r, encode
+
+class NumpyEncodeJob(EncodeJob):
+    def __init__(self, params):
+        super().__init__(params)
+        self.decoder = None
+
+    def run(self):
+        if np is None:
+            yield ("error", "NumPy engine requires numpy (pip install numpy)."); return
+        ffmpeg_path, input_path = self.params['ffmpeg_path'], self.params['input_path']
+        with self.timed("probe"): info = probe_media(ffmpeg_path, input_path)
+        if not info:
+            yield ("error", f"Cannot read video size/fps: {os.path.basename(input_path)}"); return
+        duration = info["duration"]
+        if self.params.get('max_seconds'): duration = min(duration or self.params['max_seconds'], self.params['max_seconds'])
+        filename = self.prepare()
+        yield ("log", f"▶ Start Processing: {filename} (NumPy engine)")
+        yield from self.run_pipeline(filename, info, duration)
+
+    def run_pipeline(self, filename, info, duration):
+        ffmpeg_path, input_path, output_path = self.params['ffmpeg_path'], self.params['input_path'], self.output_path
+        decode, (w, h), sx, sy, sigma_s, sigma_r, encode = numpy_plan(self.params, info)
+        frame_bytes = w * h
+        wanted = max(1, self.params.get('threads') or os.cpu_count() or 1)
+        workers, batch = batch_plan(frame_bytes, wanted)
+        if workers < wanted: yield ("log", f"NumPy engine: {workers} threads x {batch} frames (memory budget)")
+        total_frames = int(duration * fps_value(info["fps"])) if duration > 0 else 0
+
+        dec_cmd = [ffmpeg_path, "-v", "error"]
+        if self.params.get('max_seconds'): dec_cmd.extend(["-t", str(self.params['max_seconds'])])
+        dec_cmd.extend(["-i", input_path, "-vf", ",".join(decode), "-f", "rawvideo", "-pix_fmt", "gray", "-"])
+        enc_cmd = [ffmpeg_path, "-y", "-v", "error", "-f", "rawvideo", "-pix_fmt", "gray", "-s", f"{w}x{h}",
+                   "-r", str(info["fps"]), "-i", "-"]
+        if not self.params.get('max_seconds'): enc_cmd.extend(["-i", input_path, "-map", "0:v", "-map", "1:a:0?", "-c:a", "copy"])
+        enc_cmd.extend(["-vf", ",".join(encode)] + encoder_args(self.params) + [output_path])
+
+        decoder = self.decoder = subprocess.Popen(dec_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                                  creationflags=CREATION_FLAGS, bufsize=0)
+        encoder = self.process = subprocess.Popen(enc_cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+                                                  creationflags=CREATION_FLAGS)
+        if not self.is_running: self.stop()
+        err_tails = {}
+        for name, proc in (("decoder", decoder), ("encoder", encoder)):
+            threading.Thread(target=lambda n=name, p=proc: err_tails.__setitem__(n, p.stderr.read()), daemon=True).start()
+
+        # 입력/출력 버퍼 슬롯을 미리 할당해 돌려 씀
+        slots = queue.Queue()
+        for _ in range(workers + 2):
+            slots.put((np.empty((batch, h, w), np.uint8), np.empty((batch, h, w), np.uint8)))
+        local = threading.local()
+
+        filter_time = []  # 작업 스레드별 필터 계산 시간 (list.append는 스레드 안전)
+
+        def process(slot, n):
+            f = getattr(local, "filter", None)
+            if f is None: f = local.filter = BatchFilter((batch, h, w), sx, sy, sigma_s, sigma_r)
+            t = time.perf_counter()
+            f.apply(slot[0], n, slot[1])
+            filter_time.append(time.perf_counter() - t)
+            return slot, n
+
+        done = queue.Queue()  # 슬롯 수만큼만 쌓이므로 크기 제한 불필요
+        pool = ThreadPoolExecutor(max_workers=workers)
+        halt = threading.Event()
+
+        def reader():
+            try:
+                while self.is_running and not halt.is_set():
+                    slot = slots.get()
+                    if halt.is_set(): break
+                    view = memoryview(slot[0]).cast("B")
+                    filled = 0
+                    while filled < len(view):
+                        got = decoder.stdout.readinto(view[filled:])
+                        if not got: break
+                        filled += got
+                    n = filled // frame_bytes
+                    if n: done.put(pool.submit(process, slot, n))
+                    if filled < len(view): break
+            finally:
+                done.put(None)
+
+        threading.Thread(target=reader, daemon=True).start()
+        frames, failure = 0, None
+        tracker = ProgressTracker(total_frames=total_frames)
+        try:
+            while True:
+                fut = done.get()
+                if fut is None: break
+                slot, n = fut.result()
+                try:
+                    encoder.stdin.write(memoryview(slot[1][:n]).cast("B"))
+                except (BrokenPipeError, OSError, ValueError):
+                    failure = failure or "encoder"; slots.put(slot); break
+                slots.put(slot)
+                frames += n
+                if self.is_running: yield from tracker.update(frame=frames)
+        finally:
+            halt.set(); slots.put(None)  # 대기 중인 reader 깨우기
+            if failure or not self.is_running: decoder.kill()
+            pool.shutdown(wait=False, cancel_futures=True)
+            try: encoder.stdin.close()
+            except OSError: pass
+        decoder.wait(); encoder.wait()
+        self.stages["numpy_filter_cpu"] = sum(filter_time)
+
+        if not self.is_running:
+            remove_partial(output_path); yield ("cancelled", None); return
+        if failure or decoder.returncode != 0 or encoder.returncode != 0:
+            remove_partial(output_path)
+            stage = "encoder" if failure or encoder.returncode != 0 else "decoder"
+            tail = (err_tails.get(stage) or b"").decode('utf-8', 'ignore').strip().splitlines()[-5:]
+            yield ("error", f"FFmpeg {stage} failed: {filename}\n" + "\n".join(tail)); return
+        yield ("progress", 100)
+        yield ("done", output_path)
+
+    def stop(self):
+        super().stop()
+        if self.decoder:
+            try: self.decoder.kill()
+            except OSError: pass
+
+def check_engine(params, seconds=5.0):
+    # NumPy 엔진 결과를 무손실로 저장해 ffmpeg 필터 체인 결과와 비교
+    work_dir = tempfile.mkdtemp(prefix=".dme_check_")
+    try:
+        test = dict(params, output_folder=work_dir, codec="libx264", preset="ultrafast", crf=0, ext="mkv",
+                    max_seconds=seconds, engine="numpy")
+        job = NumpyEncodeJob(test)
+        for kind, value in job.run():
+            if kind == "error": raise RuntimeError(value)
+        ref_chain = plan_filter_chain(params, None, "exact")
+        drift = compare_files(params['ffmpeg_path'], job.output_path, params['input_path'], ref_chain, seconds)
+        drift["ok"] = drift["psnr"] >= ENGINE_TOLERANCE["psnr"] and drift["ssim"] >= ENGINE_TOLERANCE["ssim"]
+        return drift
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# ==========================================
+# 미리보기 (샘플 프레임은 한 번만 디코딩, 필터 결과는 LRU 캐시)
+# ==========================================
+PREVIEW_MAX_HEIGHT = 360
+
+class LRUCache:
+    def __init__(self, max_bytes):
+        self.max_bytes, self.used = max_bytes, 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None: self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None: self.used -= old.nbytes
+            self.items[key] = value; self.used += value.nbytes
+            while self.used > self.max_bytes and len(self.items) > 1:
+                _, dropped = self.items.popitem(last=False); self.used -= dropped.nbytes
+
+    def clear(self):
+        with self.lock: self.items.clear(); self.used = 0
+
+def decode_sample_frames(ffmpeg_path, input_path, count=5, max_height=PREVIEW_MAX_HEIGHT):
+    # 영상 전체에 고르게 흩어진 count장을 미리보기 해상도의 흑백 프레임으로 디코딩
+    info = probe_media(ffmpeg_path, input_path)
+    if np is None or not info: return None
+    w, h = info["width"] // 2, info["height"]
+    ph = min(h, max_height); pw = max(2, int(round(w * ph / h / 2)) * 2)
+    duration = info["duration"]
+    times = [duration * (i + 0.5) / count for i in range(count)] if duration > 0 else [0.0]
+    frames = []
+    for t in times:
+        cmd = [ffmpeg_path, "-v", "error", "-ss", f"{t:.3f}", "-i", input_path, "-frames:v", "1",
+               "-vf", f"crop=iw/2:ih:iw/2:0,scale={pw}:{ph}:flags=area,format=gray", "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+        try:
+            out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                 creationflags=CREATION_FLAGS, timeout=30).stdout
+        except subprocess.TimeoutExpired: continue
+        if len(out) >= pw * ph: frames.append((t, np.frombuffer(out[:pw * ph], np.uint8).reshape(ph, pw)))
+    return {"frames": frames, "src_size": (w, h)} if frames else None
+
+def resize_nearest(img, width, height):
+    rows = (np.arange(height) * img.shape[0] // height)
+    cols = (np.arange(width) * img.shape[1] // width)
+    return img[rows[:, None], cols]
+
+def render_preview(frame, src_size, use_filter, blur, sigmar, res_mode):
+    # 미리보기 해상도에서 필터링 (sigma는 축소 비율로 환산, fast 계획과 같은 방식)
+    ph, pw = frame.shape
+    out = frame
+    if use_filter and blur > 0:
+        fx, fy = pw / src_size[0], ph / src_size[1]
+        sx, sy = blur * fx, blur * fy
+        f = BatchFilter((1, ph, pw), sx, sy, math.sqrt(sx * sy), min(sigmar * TV_TO_FULL, 1.0))
+        filtered = np.empty((1, ph, pw), np.uint8)
+        f.apply(frame[None], 1, filtered); out = filtered[0]
+    if res_mode != "none":
+        side = min(ph, int(res_mode)); out = resize_nearest(out, side, side)
+    return np.ascontiguousarray(out)
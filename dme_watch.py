@@ -0,0 +1,204 @@
+import sys
+import os
+import json
+import time
+import select
+import signal
+import struct
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dme_core import (create_job, find_ffmpeg, default_concurrency, collect_inputs, params_from_settings,
+                      VIDEO_EXTS, DEFAULT_PARAMS)
+
+# ==========================================
+# DME 감시 폴더 모드 (IW3가 쓰는 폴더에서 완성된 새 영상만 골라 자동 처리)
+# ==========================================
+# 예: python dme_watch.py D:/iw3_out -o D:/depth --settings settings_single.json
+# 리눅스는 inotify, 그 외(또는 실패 시)는 주기적으로 폴더를 다시 읽음
+
+STATE_FILE = ".dme_watch_state.json"  # 출력 폴더에 저장 (재시작해도 끝난 작업은 건너뜀)
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x2, 0x8, 0x80, 0x100
+EVENT_HEADER = struct.Struct("iIII")  # struct inotify_event: wd, mask, cookie, len (+ name)
+
+class InotifyWatcher:
+    def __init__(self, folder):
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            err = ctypes.get_errno(); os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed: {folder}")
+        self.folder = folder
+
+    def wait(self, timeout):
+        # 변경된 파일 이름 목록 (timeout 동안 이벤트가 없으면 빈 목록)
+        if not select.select([self.fd], [], [], timeout)[0]: return []
+        names = set()
+        while True:
+            try: buf = os.read(self.fd, 65536)
+            except BlockingIOError: break
+            offset = 0
+            while offset < len(buf):
+                _, _, _, length = EVENT_HEADER.unpack_from(buf, offset)
+                name = buf[offset + EVENT_HEADER.size: offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                if name: names.add(os.path.join(self.folder, os.fsdecode(name)))
+                offset += EVENT_HEADER.size + length
+        return list(names)
+
+    def close(self): os.close(self.fd)
+
+class PollingWatcher:
+    def __init__(self, folder, interval):
+        self.folder, self.interval = folder, interval
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        return collect_inputs([self.folder])
+
+    def close(self): pass
+
+def make_watcher(folder, poll):
+    if poll is None and sys.platform.startswith("linux"):
+        try: return InotifyWatcher(folder)
+        except (OSError, AttributeError): pass
+    return PollingWatcher(folder, poll or 2.0)
+
+class WatchState:
+    # 입력 경로 -> 처리 당시 크기/mtime, 결과. 크기나 mtime이 바뀌면 새 파일로 보고 다시 처리
+    # 실패한 파일은 retry초가 지나면 다시 시도 (일시적인 오류로 영영 건너뛰지 않도록)
+    def __init__(self, path, retry):
+        self.path, self.retry = path, retry
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self.entries = json.load(f)
+        except (OSError, ValueError): self.entries = {}
+
+    def is_handled(self, path, sig):
+        e = self.entries.get(path)
+        if e is None or (e['size'], e['mtime_ns']) != sig: return False
+        return e['status'] == "done" or time.time() - e.get('failed_at', 0) < self.retry
+
+    def due_retries(self):
+        now = time.time()
+        with self.lock:
+            return [p for p, e in self.entries.items() if e['status'] != "done" and now - e.get('failed_at', 0) >= self.retry]
+
+    def record(self, path, sig, status, outputs):
+        with self.lock:
+            self.entries[path] = {'size': sig[0], 'mtime_ns': sig[1], 'status': status,
+                                  'outputs': outputs, 'finished': time.strftime("%Y-%m-%d %H:%M:%S")}
+            if status != "done": self.entries[path]['failed_at'] = time.time()
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(self.entries, f, indent=1)
+            os.replace(tmp, self.path)
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="dme-watch", description="Depth Map Extract (DME) - watch folder mode")
+    p.add_argument("folder", help="input folder to watch (e.g. IW3 output folder)")
+    p.add_argument("-o", "--output", help="output folder (default: 'output' from the settings file)")
+    p.add_argument("--settings", default="settings_single.json",
+                   help="GUI settings file used for every job; re-read before each job (default: settings_single.json)")
+    p.add_argument("--ffmpeg", help="path to ffmpeg binary (default: auto-detect)")
+    p.add_argument("--state", help=f"state file (default: <output>/{STATE_FILE})")
+    p.add_argument("--stable", type=float, default=10.0,
+                   help="seconds a file's size/mtime must stay unchanged before it is processed (default 10)")
+    p.add_argument("--poll", type=float, help="force polling with this interval in seconds instead of inotify")
+    p.add_argument("--retry", type=float, default=600.0,
+                   help="seconds before a failed file is tried again (default 600)")
+    p.add_argument("--once", action="store_true", help="process what is already there, then exit")
+    p.add_argument("-j", "--jobs", type=int, default=0, help="parallel jobs (0 = auto)")
+    return p
+
+def load_settings(path):
+    try:
+        with open(path, 'r') as f: return json.load(f)
+    except (OSError, ValueError): return {}
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    ffmpeg_path = args.ffmpeg or find_ffmpeg()
+    if not ffmpeg_path:
+        print("FFmpeg not found.", file=sys.stderr); return 2
+    folder = os.path.abspath(args.folder)
+    output = args.output or load_settings(args.settings).get("output")
+    if not os.path.isdir(folder) or not output:
+        print("Input folder and output folder are required.", file=sys.stderr); return 2
+    output = os.path.abspath(output)
+    if os.path.normcase(output) == os.path.normcase(folder):
+        print("Output folder must differ from the watched folder.", file=sys.stderr); return 2
+    os.makedirs(output, exist_ok=True)
+
+    state = WatchState(args.state or os.path.join(output, STATE_FILE), args.retry)
+    watcher = make_watcher(folder, args.poll)
+    codec = load_settings(args.settings).get("codec", DEFAULT_PARAMS['codec'])
+    pool = ThreadPoolExecutor(max_workers=args.jobs or default_concurrency(codec))
+    print_lock, stop = threading.Lock(), threading.Event()
+    running = {}  # 입력 경로 -> 작업
+
+    def say(msg, err=False):
+        with print_lock: print(f"[{time.strftime('%H:%M:%S')}] {msg}", file=sys.stderr if err else sys.stdout, flush=True)
+
+    def process(path, sig):
+        if stop.is_set(): running.pop(path, None); return  # 중단 후에는 대기 중인 파일을 처리하지 않음
+        status, outputs = "failed", []
+        try:
+            params = params_from_settings(load_settings(args.settings), path, output, ffmpeg_path)
+            job = running[path] = create_job(params)
+            for kind, value in job.run():
+                if kind == "log": say(value)
+                elif kind == "error": say(f"✖ {value}", err=True)
+                elif kind == "done":
+                    status, outputs = "done", value if isinstance(value, list) else [value]
+                    for out in outputs: say(f"✔ {out}")
+                elif kind == "cancelled": status = "cancelled"
+        except Exception as e:
+            say(f"✖ {os.path.basename(path)}: {e}", err=True)
+        finally:
+            # 취소된 작업은 기록하지 않아 다음 실행 때 다시 처리
+            if status != "cancelled": state.record(path, sig, status, outputs)
+            running.pop(path, None)
+
+    def on_signal(*_): stop.set()
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"): signal.signal(signal.SIGTERM, on_signal)
+
+    say(f"Watching {folder} -> {output} ({type(watcher).__name__})")
+    candidates = set(collect_inputs([folder]))  # 시작 전에 이미 있던 파일도 확인
+    seen = {}  # 경로 -> ((크기, mtime), 처음 그 값으로 본 시각)
+    try:
+        while not stop.is_set():
+            for path in watcher.wait(1.0):
+                if path.lower().endswith(VIDEO_EXTS): candidates.add(path)
+            if not args.once: candidates.update(p for p in state.due_retries() if p not in running)
+            now = time.time()
+            for path in sorted(candidates):
+                try: st = os.stat(path)
+                except OSError:
+                    candidates.discard(path); seen.pop(path, None); continue
+                sig = (st.st_size, st.st_mtime_ns)
+                if state.is_handled(path, sig) or path in running:
+                    if path not in running: candidates.discard(path); seen.pop(path, None)
+                    continue
+                prev = seen.get(path)
+                if prev is None or prev[0] != sig:
+                    # 오래전에 쓰인 파일은 바로 완성된 것으로 봄
+                    seen[path] = (sig, now if now - st.st_mtime < args.stable else now - args.stable); continue
+                if now - prev[1] >= args.stable and st.st_size > 0:
+                    candidates.discard(path); seen.pop(path, None)
+                    running[path] = None
+                    pool.submit(process, path, sig)
+            if args.once and not candidates and not running: break
+    finally:
+        if stop.is_set():
+            say("🛑 Stopping...", err=True)
+            for job in list(running.values()):
+                if job: job.stop()
+        pool.shutdown(wait=True, cancel_futures=stop.is_set())
+        watcher.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())